@@ -0,0 +1,147 @@
+"""
+Audio playback in a dedicated process.
+
+ffpyplayer decodes and plays audio on threads that hold the GIL while they run Python code,
+which delays the render loop when it runs in the same process. Here the MediaPlayer lives in its
+own process. Commands are sent to it through a pipe, and it publishes its clock through shared
+memory, so the render loop reads the audio position without blocking or calling into ffpyplayer.
+"""
+
+import multiprocessing
+import signal
+import time
+
+# Seconds between two updates of the published clock. Commands are handled as soon as they arrive.
+CLOCK_INTERVAL = 0.005
+# The clock is extrapolated from the last update by at most this many seconds,
+# so it doesn't run away when the audio stalls or ends
+MAX_EXTRAPOLATION = 0.1
+
+# Layout of the shared clock. The sequence number is odd while the clock is being written.
+# _HAS_PTS is 0 while the player has no pts (e.g. before the first audio frame), so commands
+# are still acknowledged then.
+_SEQUENCE, _PTS, _SAMPLED_AT, _PAUSED, _HAS_PTS, _COMMANDS_DONE = range(6)
+
+def _publish_clock(clock, pts: float | None, paused: bool, commands_done: int):
+    clock[_SEQUENCE] += 1
+    clock[_PTS] = pts or 0.0
+    clock[_SAMPLED_AT] = time.monotonic()
+    clock[_PAUSED] = paused
+    clock[_HAS_PTS] = pts is not None
+    clock[_COMMANDS_DONE] = commands_done
+    clock[_SEQUENCE] += 1
+
+def _audio_process(file_path: str, commands, sender, clock):
+    """
+    Standalone function to run in a separate process.
+    Plays the audio of file_path, runs the (command, value) tuples received on commands and
+    publishes the pts of the player to clock after every command and every CLOCK_INTERVAL.
+    """
+    # The player closes the audio through a command, so it can be muted first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Only the player may hold the sending end, so the pipe reports EOF once the player is gone
+    sender.close()
+
+    # Imported here, the player process is the only one that needs ffpyplayer
+    from ffpyplayer.player import MediaPlayer
+
+    try:
+        player = MediaPlayer(file_path, ff_opts={'vn': True, 'sn': True}, loglevel='quiet')
+    except Exception:
+        # E.g. no audio device. The clock is never published, so the video runs on the wall clock.
+        return
+    paused = False
+    commands_done = 0
+
+    try:
+        while True:
+            if commands.poll(CLOCK_INTERVAL):
+                try:
+                    command, value = commands.recv()
+                except EOFError:
+                    # The player process is gone
+                    break
+
+                if command == 'close':
+                    break
+                elif command == 'pause':
+                    player.set_pause(value)
+                    paused = value
+                elif command == 'volume':
+                    player.set_volume(value)
+                elif command == 'seek':
+                    pts, relative = value
+                    player.seek(pts, relative=relative)
+                commands_done += 1
+
+            _publish_clock(clock, player.get_pts(), paused, commands_done)
+    finally:
+        player.close_player()
+
+class AudioPlayer:
+    """
+    Plays the audio of a file in a separate process. Mirrors the parts of the
+    ffpyplayer.player.MediaPlayer interface the player uses. Playback starts right away.
+
+    Args:
+        file_path: The path to the media file.
+    """
+
+    def __init__(self, file_path: str):
+        # Written by the audio process, read here without locking
+        self.clock = multiprocessing.Array('d', _COMMANDS_DONE + 1, lock=False)
+        commands, self.commands = multiprocessing.Pipe(duplex=False)
+        self.commands_sent = 0
+        self.process = multiprocessing.Process(
+            target=_audio_process,
+            args=(file_path, commands, self.commands, self.clock),
+            daemon=True
+        )
+        self.process.start()
+        commands.close()
+
+    def _send(self, command: str, value=None):
+        try:
+            self.commands.send((command, value))
+        except OSError:
+            # The audio process is gone, there is nothing left to control
+            return
+        self.commands_sent += 1
+
+    def get_pts(self) -> float | None:
+        """
+        Returns the audio clock in seconds, or None while the player has no pts or the audio
+        process hasn't published a clock that reflects all commands sent so far.
+        """
+        clock = self.clock
+        for _ in range(3):
+            sequence = clock[_SEQUENCE]
+            pts, sampled_at, paused, has_pts, commands_done = clock[_PTS:_COMMANDS_DONE + 1]
+            # Only use a clock that wasn't being written while it was read
+            if sequence % 2 == 0 and clock[_SEQUENCE] == sequence:
+                break
+        else:
+            return None
+
+        if not has_pts or commands_done < self.commands_sent:
+            return None
+        if not paused:
+            pts += min(time.monotonic() - sampled_at, MAX_EXTRAPOLATION)
+        return pts
+
+    def set_pause(self, paused: bool):
+        self._send('pause', paused)
+
+    def set_volume(self, volume: float):
+        self._send('volume', volume)
+
+    def seek(self, pts: float, relative: bool = True):
+        self._send('seek', (pts, relative))
+
+    def close_player(self):
+        """Stops playback and waits for the audio process to exit."""
+        self._send('close')
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.commands.close()
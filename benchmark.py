@@ -0,0 +1,380 @@
+"""
+Encoder benchmarks.
+
+Every benchmark runs on a video file if one is given, or on synthetic footage otherwise.
+
+    python benchmark.py rows --file /path/to/your/video.mp4 --size 64
+    python benchmark.py diff
+    python benchmark.py scroll
+    python benchmark.py perceptual
+    python benchmark.py quality --glyphs quadrant
+    python benchmark.py interlace
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import frame_cache
+import renderer
+import virtual_terminal
+
+def synthetic_pan(frame_size: tuple[int, int], frame_count: int = 120, speed: int = 1):
+    """
+    Yields frames of a slow horizontal pan over a flat-shaded skyline.
+    Flat areas stay unchanged while the edges of the buildings move, like real panning footage.
+
+    Args:
+        frame_size: The (width, height) of the frames.
+        frame_count: The number of frames to generate.
+        speed: Pixels the camera moves per frame.
+    """
+    width, height = frame_size
+    rng = np.random.default_rng(0)
+    panorama_width = width + frame_count * speed
+    panorama = np.empty((height, panorama_width, 3), dtype=np.uint8)
+    panorama[:] = (200, 150, 90)
+
+    x = 0
+    while x < panorama_width:
+        building_width = int(rng.integers(4, 16))
+        top = int(rng.integers(height // 4, height - 2))
+        color = rng.integers(20, 120, size=3)
+        panorama[top:, x:x + building_width] = color
+        # Lit windows on every other row
+        panorama[top + 1::2, x + 1:x + building_width - 1:3] = (60, 200, 230)
+        x += building_width
+
+    for i in range(frame_count):
+        yield panorama[:, i * speed:i * speed + width].copy()
+
+def synthetic_credits(frame_size: tuple[int, int], frame_count: int = 120, speed: int = 2):
+    """
+    Yields frames of end credits: lines of bright "text" blocks scrolling up over a dark background.
+
+    Args:
+        frame_size: The (width, height) of the frames.
+        frame_count: The number of frames to generate.
+        speed: Pixels the credits move up per frame.
+    """
+    width, height = frame_size
+    rng = np.random.default_rng(0)
+    roll_height = height + frame_count * speed
+    roll = np.full((roll_height, width, 3), 16, dtype=np.uint8)
+
+    for top in range(0, roll_height - 4, 6):
+        # A centered line of text, drawn as random glyph-sized blocks
+        line_width = int(rng.integers(width // 4, width * 3 // 4))
+        left = (width - line_width) // 2
+        glyphs = rng.random((4, line_width)) > 0.5
+        roll[top:top + 4, left:left + line_width][glyphs] = (235, 235, 235)
+
+    for i in range(frame_count):
+        yield roll[i * speed:i * speed + height].copy()
+
+def synthetic_grain(frame_size: tuple[int, int], frame_count: int = 120, grain: float = 6.0):
+    """
+    Yields frames of a dark, flat scene with film grain, a textured wall and a bright object moving across.
+
+    Args:
+        frame_size: The (width, height) of the frames.
+        frame_count: The number of frames to generate.
+        grain: Standard deviation of the grain noise.
+    """
+    width, height = frame_size
+    rng = np.random.default_rng(0)
+    scene = np.full((height, width, 3), 24, dtype=np.float32)
+    # Textured wall on the right third
+    scene[:, width * 2 // 3:] = rng.integers(60, 180, size=(height, width - width * 2 // 3, 1))
+    object_size = max(height // 4, 2)
+
+    for i in range(frame_count):
+        frame = scene + rng.normal(0, grain, size=(height, width, 1))
+        x = i * (width - object_size) // max(frame_count - 1, 1)
+        top = (height - object_size) // 2
+        frame[top:top + object_size, x:x + object_size] = (40, 180, 230)
+        yield np.clip(frame, 0, 255).astype(np.uint8)
+
+def mean_squared_error(reference: np.ndarray, image: np.ndarray) -> float:
+    return float(np.mean((reference.astype(np.float32) - image.astype(np.float32)) ** 2))
+
+def load_frames(file_path: str, frame_size: tuple[int, int], frame_count: int):
+    """Yields up to frame_count frames of a video file, resized like the producer does."""
+    cap = cv2.VideoCapture(file_path)
+    try:
+        for _ in range(frame_count):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield cv2.resize(frame, frame_size, interpolation=cv2.INTER_LINEAR)
+    finally:
+        cap.release()
+
+def load_cached_frames(args, frame_size: tuple[int, int]):
+    """
+    Returns up to args.frames frames of args.file from the frame cache the player uses.
+    On a miss the whole file is decoded into the cache first, so later runs skip decoding.
+    """
+    cache = frame_cache.FrameCache()
+    cached = cache.load(args.file, args.size, args.glyphs)
+    if cached is None:
+        cap = cv2.VideoCapture(args.file)
+        frame_rate = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        writer = cache.create(args.file, args.size, args.glyphs, frame_size,
+                              frame_rate, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap.release()
+        if writer is None:
+            return list(load_frames(args.file, frame_size, args.frames))
+        for i, frame in enumerate(load_frames(args.file, frame_size, 2 ** 31)):
+            # Timestamps in seconds, like the producer writes them
+            writer.append(frame, i / frame_rate)
+        writer.finish()
+        cached = cache.load(args.file, args.size, args.glyphs)
+
+    if cached.frames.shape[2:0:-1] != frame_size:
+        # An odd --size is rounded up by the player, so its frames don't fit
+        return list(load_frames(args.file, frame_size, args.frames))
+    return list(cached.frames[:args.frames])
+
+def get_frames(args, encoder, synthetic=synthetic_pan):
+    if args.file and args.cache:
+        return load_cached_frames(args, encoder.frame_size)
+    if args.file:
+        return list(load_frames(args.file, encoder.frame_size, args.frames))
+    if synthetic is synthetic_grain:
+        return list(synthetic_grain(encoder.frame_size, args.frames))
+    if synthetic is synthetic_credits:
+        # Scroll by one row of cells per frame
+        return list(synthetic_credits(encoder.frame_size, args.frames, encoder.cell_height))
+    return list(synthetic(encoder.frame_size, args.frames))
+
+def get_columns(args) -> int:
+    """Returns the width in cells of the video for the benchmark's --size."""
+    if not args.file:
+        return args.size * 16 // 9
+    cap = cv2.VideoCapture(args.file)
+    aspect_ratio = cap.get(cv2.CAP_PROP_FRAME_WIDTH) / cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    cap.release()
+    return int(args.size * aspect_ratio)
+
+def encode_all(encoder, frames) -> tuple[int, float]:
+    """Encodes all frames and returns (total bytes, seconds)."""
+    total_bytes = 0
+    start_time = time.perf_counter()
+    for frame in frames:
+        total_bytes += len(encoder.render(frame))
+    return total_bytes, time.perf_counter() - start_time
+
+def report(name: str, total_bytes: int, seconds: float, frame_count: int):
+    print(f"{name:<24} {total_bytes / frame_count / 1024:8.2f} KB/frame {seconds / frame_count * 1000:8.2f} ms/frame")
+
+def bench_rows(args):
+    """Compares sparse updates only against the per-row choice of sparse updates or a full rewrite."""
+    columns = get_columns(args)
+    results = {}
+    for adaptive_rows in (False, True):
+        encoder = renderer.TerminalRenderer(columns, args.size // 2, args.compression, args.glyphs,
+                                            adaptive_rows=adaptive_rows)
+        frames = get_frames(args, encoder)
+        total_bytes, seconds = encode_all(encoder, frames)
+        name = 'adaptive rows' if adaptive_rows else 'sparse only'
+        report(name, total_bytes, seconds, len(frames))
+        results[adaptive_rows] = total_bytes
+
+    print(f"Rows rewritten: {encoder.stats['rows_rewritten']}")
+    print(f"Bytes saved: {(results[False] - results[True]) / max(results[False], 1) * 100:.1f}%")
+
+def bench_scroll(args):
+    """Compares plain diffs against terminal scroll commands plus the residual diff on scrolling content."""
+    columns = get_columns(args)
+    for scroll in (False, True):
+        encoder = renderer.TerminalRenderer(columns, args.size // 2, args.compression, args.glyphs, scroll=scroll)
+        frames = get_frames(args, encoder, synthetic_credits)
+        total_bytes, seconds = encode_all(encoder, frames)
+        report('scroll commands' if scroll else 'diff only', total_bytes, seconds, len(frames))
+
+    print(f"Scrolled frames: {encoder.stats['scroll_frames']} of {len(frames)}")
+
+def bench_perceptual(args):
+    """Compares the global threshold against the perceptual per-cell thresholds on grainy footage."""
+    columns = get_columns(args)
+    for perceptual in (False, True):
+        encoder = renderer.TerminalRenderer(columns, args.size // 2, args.compression, args.glyphs,
+                                            perceptual=perceptual)
+        frames = get_frames(args, encoder, synthetic_grain)
+        screen = virtual_terminal.VirtualTerminal(encoder.columns, encoder.rows, args.glyphs)
+        total_bytes = 0
+        errors = []
+        start_time = time.perf_counter()
+        for frame in frames:
+            data = encoder.render(frame)
+            total_bytes += len(data)
+            # The displayed image against the source it approximates
+            screen.feed(data)
+            errors.append(mean_squared_error(frame, screen.get_image()))
+        seconds = time.perf_counter() - start_time
+        report('perceptual thresholds' if perceptual else 'global threshold', total_bytes, seconds, len(frames))
+        print(f"{'':<24} {virtual_terminal.psnr_from_mse(np.mean(errors)):8.2f} dB PSNR")
+
+def bench_interlace(args):
+    """Compares bytes per frame and displayed quality of full updates with interlaced row updates."""
+    columns = get_columns(args)
+    for level in (1, 2, 3):
+        encoder = renderer.TerminalRenderer(columns, args.size // 2, args.compression, args.glyphs)
+        encoder.interlace = level
+        frames = get_frames(args, encoder)
+        stream = [encoder.render(frame) for frame in frames]
+        images = list(virtual_terminal.replay(stream, encoder.columns, encoder.rows, args.glyphs))
+
+        kilobytes = sum(len(data) for data in stream) / len(frames) / 1024
+        quality = virtual_terminal.psnr_from_mse(
+            np.mean([mean_squared_error(frame, image) for frame, image in zip(frames, images)]))
+        name = 'full updates' if level == 1 else f'1 in {level} rows'
+        print(f"{name:<24} {kilobytes:8.2f} KB/frame {quality:8.2f} dB PSNR")
+
+def bench_quality(args):
+    """
+    Replays the encoded stream on a virtual terminal and reports the quality of the displayed
+    images against the resized source, for a range of compression thresholds.
+    With --expect, fails unless the displayed images hash to the given golden value.
+    """
+    columns = get_columns(args)
+    thresholds = [args.compression] if args.expect else [args.compression // 4, args.compression // 2,
+                                                         args.compression, args.compression * 2]
+    print(f"{'compression':<12} {'KB/frame':>9} {'PSNR dB':>8} {'SSIM':>7} {'dB/KB':>7}  displayed frames hash")
+    for compression in thresholds:
+        encoder = renderer.TerminalRenderer(columns, args.size // 2, compression, args.glyphs, scroll=args.scroll)
+        frames = get_frames(args, encoder)
+        stream = [encoder.render(frame) for frame in frames]
+        images = list(virtual_terminal.replay(stream, encoder.columns, encoder.rows, args.glyphs))
+
+        kilobytes = sum(len(data) for data in stream) / len(frames) / 1024
+        quality = virtual_terminal.psnr_from_mse(
+            np.mean([mean_squared_error(frame, image) for frame, image in zip(frames, images)]))
+        similarity = np.mean([virtual_terminal.ssim(frame, image) for frame, image in zip(frames, images)])
+        digest = virtual_terminal.frame_hash(images)
+        print(f"{compression:<12} {kilobytes:9.2f} {quality:8.2f} {similarity:7.4f} {quality / kilobytes:7.3f}  {digest[:16]}")
+
+        if args.glyphs == 'half' and not np.array_equal(images[-1], encoder.displayed_image):
+            # Half blocks are exact, so the screen has to match the encoder's idea of it
+            print("Displayed image differs from the encoder state.")
+            sys.exit(1)
+
+    if args.expect:
+        if not digest.startswith(args.expect):
+            print(f"Golden hash mismatch: expected {args.expect}, got {digest}")
+            sys.exit(1)
+        print("Golden hash matches.")
+
+def legacy_diff(blocks: np.ndarray, prev_blocks: np.ndarray, compression: int) -> tuple[np.ndarray, np.ndarray]:
+    """The int16 diff the producer used before the preallocated workspaces, for comparison."""
+    blocks = blocks.astype(np.int16)
+    diff_vals = np.abs(blocks - prev_blocks)
+    weighted_diff = diff_vals * renderer.PERCEPTUAL_WEIGHTS
+    diff_score = np.sum(weighted_diff, axis=(1, 3, 4))
+    change_mask = diff_score > compression
+    return change_mask, np.where(change_mask[:, None, :, None, None], blocks, prev_blocks)
+
+# Traced memory growth from which a bytecode instruction counts as an allocation.
+# Smaller growth is mostly interpreter bookkeeping (ints, tuples) rather than array temporaries.
+ALLOCATION_MIN_BYTES = 1024
+
+def count_allocations(kernel, frame) -> int:
+    """
+    Runs kernel on frame and counts the bytecode instructions after which tracemalloc traces at least
+    ALLOCATION_MIN_BYTES more than before. Numpy expressions allocate their temporaries in separate
+    instructions, but several allocations inside one call (e.g. np.where) count once.
+    """
+    allocations = 0
+    last_size, _ = tracemalloc.get_traced_memory()
+
+    def trace(code_frame, event, arg):
+        nonlocal allocations, last_size
+        code_frame.f_trace_opcodes = True
+        if event == 'opcode':
+            size, _ = tracemalloc.get_traced_memory()
+            if size - last_size >= ALLOCATION_MIN_BYTES:
+                allocations += 1
+            last_size = size
+        return trace
+
+    sys.settrace(trace)
+    try:
+        kernel(frame)
+    finally:
+        sys.settrace(None)
+    return allocations
+
+def measure_kernel(kernel, frames) -> tuple[float, int, float]:
+    """
+    Runs kernel on every frame and returns (seconds per frame, peak temporary bytes per frame,
+    allocations per frame, see count_allocations).
+    """
+    kernel(frames[0])
+    start_time = time.perf_counter()
+    for frame in frames:
+        kernel(frame)
+    seconds = (time.perf_counter() - start_time) / len(frames)
+
+    tracemalloc.start()
+    peak_bytes = 0
+    for frame in frames:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        kernel(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes = max(peak_bytes, peak - baseline)
+    # Tracing every instruction is slow, so it gets its own pass after the timed and peak ones
+    allocations = sum(count_allocations(kernel, frame) for frame in frames) / len(frames)
+    tracemalloc.stop()
+    return seconds, peak_bytes, allocations
+
+def bench_diff(args):
+    """Compares the time, temporary memory and allocations of the diff stage with the legacy int16 diff."""
+    encoder = renderer.TerminalRenderer(get_columns(args), args.size // 2, args.compression, args.glyphs)
+    frames = get_frames(args, encoder)
+    shape = (encoder.rows, encoder.cell_height, encoder.columns, encoder.cell_width, 3)
+
+    encoder.render(frames[0])
+    def workspace_kernel(frame):
+        encoder.update(frame)
+
+    prev_blocks = frames[0].reshape(shape).astype(np.int16)
+    def legacy_kernel(frame):
+        nonlocal prev_blocks
+        _, prev_blocks = legacy_diff(frame.reshape(shape), prev_blocks, encoder.compression)
+
+    for name, kernel in (('legacy int16 diff', legacy_kernel), ('workspace diff', workspace_kernel)):
+        seconds, peak_bytes, allocations = measure_kernel(kernel, frames)
+        print(f"{name:<24} {seconds * 1000:8.3f} ms/frame {peak_bytes / 1024:10.1f} KB temporary memory/frame "
+              f"{allocations:6.1f} allocations/frame")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the frame encoder.")
+    parser.add_argument("benchmark", choices=["rows", "diff", "scroll", "perceptual", "quality", "interlace"], help="The benchmark to run.")
+    parser.add_argument("--file", default=None, help="The video to benchmark with (default: synthetic footage).")
+    parser.add_argument("--size", type=int, default=64, help="The size of the video element (default: 64).")
+    parser.add_argument("--frames", type=int, default=120, help="The number of frames to encode (default: 120).")
+    parser.add_argument("--compression", type=int, default=150, help="The threshold for color change detection (default: 150).")
+    parser.add_argument("--glyphs", default="half", help="The glyph mode (default: half).")
+    parser.add_argument("--cache", action="store_true", help="Read the frames of --file from the player's frame cache, filling it on the first run.")
+    parser.add_argument("--scroll", action="store_true", help="Send scrolls as terminal scroll commands (quality only).")
+    parser.add_argument("--expect", default=None, help="The golden hash (or a prefix of it) the displayed frames must match (quality only).")
+    args = parser.parse_args()
+
+    if args.benchmark == "rows":
+        bench_rows(args)
+    elif args.benchmark == "diff":
+        bench_diff(args)
+    elif args.benchmark == "scroll":
+        bench_scroll(args)
+    elif args.benchmark == "perceptual":
+        bench_perceptual(args)
+    elif args.benchmark == "quality":
+        bench_quality(args)
+    elif args.benchmark == "interlace":
+        bench_interlace(args)
@@ -174,16 +174,21 @@ class DaemonManager:
         sys.stderr = StderrToLogger(self.logger, logging.ERROR)
     
     def update_daemon(self, frames_shown: int, total_frames: int, frames_buffered: float, 
-                      data_throughput: float, playback_speed: float):
+                      data_throughput: float, playback_speed: float, tile_stats: list | None = None,
+                      producer_stats: dict | None = None, resource_stats: dict | None = None):
         """
         Send a status update to the daemon terminal.
         
         Args:
             frames_shown: Number of frames shown so far
-            total_frames: Total number of frames in the video
+            total_frames: Total number of frames in the video, 0 if unknown (live sources)
             frames_buffered: Number of frames buffered
             data_throughput: Data throughput per frame (in KB)
             playback_speed: Current playback speed ratio (actual fps / target fps)
+            tile_stats: Optional per-tile stats in mosaic mode (dicts with name, frames_shown,
+                total_frames, frames_buffered and data_throughput)
+            producer_stats: Optional counters of the producer process (name -> value)
+            resource_stats: Optional latest sample of the resource monitor (name -> value)
         """
         if self.daemon_sock is None:
             return
@@ -195,6 +200,12 @@ class DaemonManager:
                 'data_throughput': data_throughput,
                 'playback_speed': playback_speed
             }
+            if tile_stats is not None:
+                msg_dict['tile_stats'] = tile_stats
+            if producer_stats is not None:
+                msg_dict['producer_stats'] = producer_stats
+            if resource_stats is not None:
+                msg_dict['resource_stats'] = resource_stats
             json_msg = json.dumps(msg_dict)
             self.daemon_sock.sendto(json_msg.encode('utf-8'), ('127.0.0.1', self.port))
         except Exception:
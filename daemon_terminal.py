@@ -82,12 +82,38 @@ class LogReceiverDaemon:
         
         # Build the stats display
         stats_text = f"{self.term.bold}Video Playback Statistics:{self.term.normal}\n"
-        stats_text += f"Frames Shown:{self.term.normal} {min(int(self.daemon_stats['frames_shown']), int(self.daemon_stats['total_frames']))}\n"
-        stats_text += f"Total Frames:{self.term.normal} {self.daemon_stats['total_frames']}\n"
+        frames_shown = int(self.daemon_stats['frames_shown'])
+        total_frames = int(self.daemon_stats['total_frames'])
+        if total_frames > 0:
+            stats_text += f"Frames Shown:{self.term.normal} {min(frames_shown, total_frames)}\n"
+            stats_text += f"Total Frames:{self.term.normal} {total_frames}\n"
+        else:
+            # Live sources have no known length
+            stats_text += f"Frames Shown:{self.term.normal} {frames_shown}\n"
+            stats_text += f"Total Frames:{self.term.normal} unknown\n"
         stats_text += f"Playback Speed:{self.term.normal} {playback_speed_color}{playback_speed_percent:.2f}%{self.term.normal}\n"
         stats_text += f"Frames Buffered:{self.term.normal} {idle_time_color}{frames_buffered}{self.term.normal}\n"
         stats_text += f"Data Throughput:{self.term.normal} {self.daemon_stats['data_throughput']:.2f} KB/frame"
 
+        for name, value in self.daemon_stats.get('producer_stats', {}).items():
+            label = name.replace('_', ' ').title()
+            stats_text += f"\n{label}:{self.term.normal} {value}"
+
+        resource_stats = self.daemon_stats.get('resource_stats', {})
+        if resource_stats:
+            stats_text += f"\n{self.term.bold}Resources:{self.term.normal}"
+        for name, value in resource_stats.items():
+            label = name.replace('_', ' ').title()
+            stats_text += f"\n{label}:{self.term.normal} {value}"
+
+        for tile in self.daemon_stats.get('tile_stats', []):
+            stats_text += (
+                f"\n{self.term.bold}{tile['name']}:{self.term.normal} "
+                f"{tile['frames_shown']}/{tile['total_frames']} frames, "
+                f"{int(tile['frames_buffered'])} buffered, "
+                f"{tile['data_throughput']:.2f} KB/frame"
+            )
+
         # Create progress bar
         progress_bar = self.create_progress_bar()
 
@@ -103,8 +129,8 @@ class LogReceiverDaemon:
         frames_shown = self.daemon_stats['frames_shown']
         total_frames = self.daemon_stats['total_frames']
         
-        if total_frames == 0:
-            # No frames yet, show empty progress bar
+        if total_frames <= 0:
+            # No frames yet or a live source without a known length, show empty progress bar
             return '-' * terminal_width
         
         # Calculate the position of the playhead
@@ -161,7 +187,7 @@ class LogReceiverDaemon:
         try:
             while self.running:
                 try:
-                    data, addr = self.sock.recvfrom(4096)
+                    data, addr = self.sock.recvfrom(65535)
                     message = data.decode('utf-8')
                     self.parse_message(message)
                 except socket.timeout:
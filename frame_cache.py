@@ -0,0 +1,160 @@
+"""
+On-disk proxy cache of decoded and resized frames.
+
+The frames of a source at a given size and glyph mode are stored as one raw uint8 array that is
+memory-mapped on playback, so the producer skips decoding and resizing entirely. Entries are
+written while the source is played for the first time and evicted least recently used first
+when the cache grows beyond its disk budget.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'terminal_video_player', 'frames')
+DEFAULT_CACHE_BUDGET = 4 * 1024 * 1024 * 1024 # 4GB
+
+class CachedFrames:
+    """
+    The frames of one cache entry.
+
+    Frames are indexed by their position in the source, like the producer counts them.
+
+    Attributes:
+        frames: Memory-mapped frames (Frames, Height, Width, 3) in uint8 BGR.
+        timestamps: The source timestamp of every frame in seconds.
+    """
+
+    def __init__(self, frames: np.memmap, timestamps: np.ndarray):
+        self.frames = frames
+        self.timestamps = timestamps
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+class _CacheWriter:
+    """Appends the frames of a new entry and publishes it once the source was read to the end."""
+
+    def __init__(self, cache: 'FrameCache', key: str, frame_size: tuple[int, int], frame_rate: float):
+        self.cache = cache
+        self.key = key
+        self.frame_size = frame_size
+        self.frame_rate = frame_rate
+        self.timestamps = []
+        # Temporary names are per process, so two players of the same source don't collide
+        self.temp_path = cache._path(key, f'frames.{os.getpid()}.tmp')
+        self.file = open(self.temp_path, 'wb')
+
+    def append(self, frame: np.ndarray, timestamp: float):
+        self.file.write(frame.data)
+        self.timestamps.append(timestamp)
+
+    def finish(self):
+        """Publishes the entry. The metadata is written last and marks the entry as complete."""
+        self.file.close()
+        os.replace(self.temp_path, self.cache._path(self.key, 'frames'))
+        np.save(self.cache._path(self.key, 'index.npy'), np.array(self.timestamps, dtype=np.float64))
+        metadata = {
+            'frame_size': self.frame_size,
+            'frame_count': len(self.timestamps),
+            'frame_rate': self.frame_rate
+        }
+        with open(self.cache._path(self.key, 'json'), 'w') as f:
+            json.dump(metadata, f)
+        self.cache.evict(keep=self.key)
+
+    def discard(self):
+        """Drops an entry that wasn't read to the end."""
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+class FrameCache:
+    """
+    Proxy cache of resized frames, keyed by source file, size and glyph mode.
+
+    Args:
+        directory: Where the entries are stored.
+        budget: Disk space in bytes the entries may use together.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, budget: int = DEFAULT_CACHE_BUDGET):
+        self.directory = directory
+        self.budget = budget
+
+    def _key(self, file_path: str, resolution: int, glyph_mode: str) -> str:
+        # A modified source gets a new key, its old entry ages out of the cache
+        stat = os.stat(file_path)
+        source = f'{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{resolution}|{glyph_mode}'
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f'{key}.{suffix}')
+
+    def load(self, file_path: str, resolution: int, glyph_mode: str) -> CachedFrames | None:
+        """Returns the cached frames of a source, or None if they aren't cached."""
+        try:
+            key = self._key(file_path, resolution, glyph_mode)
+            with open(self._path(key, 'json')) as f:
+                metadata = json.load(f)
+            width, height = metadata['frame_size']
+            frames = np.memmap(self._path(key, 'frames'), dtype=np.uint8, mode='r',
+                               shape=(metadata['frame_count'], height, width, 3))
+            timestamps = np.load(self._path(key, 'index.npy'))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Mark the entry as recently used
+        os.utime(self._path(key, 'json'))
+        return CachedFrames(frames, timestamps)
+
+    def create(self, file_path: str, resolution: int, glyph_mode: str, frame_size: tuple[int, int],
+               frame_rate: float, frame_count: int) -> _CacheWriter | None:
+        """
+        Starts a new entry for a source, evicting old entries to make room for it.
+
+        Returns:
+            A writer for the frames, or None if the entry wouldn't fit into the budget.
+        """
+        width, height = frame_size
+        if frame_count * width * height * 3 > self.budget:
+            return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.evict(reserve=frame_count * width * height * 3)
+            return _CacheWriter(self, self._key(file_path, resolution, glyph_mode), frame_size, frame_rate)
+        except OSError:
+            return None
+
+    def evict(self, reserve: int = 0, keep: str | None = None):
+        """Removes the least recently used entries until reserve more bytes fit into the budget."""
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            paths = [self._path(key, suffix) for suffix in ('json', 'frames', 'index.npy')]
+            try:
+                size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+                last_used = os.path.getmtime(paths[0])
+            except OSError:
+                continue
+            entries.append((last_used, key, size, paths))
+            total_size += size
+
+        for _, key, size, paths in sorted(entries):
+            if total_size + reserve <= self.budget:
+                break
+            if key == keep:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total_size -= size
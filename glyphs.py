@@ -0,0 +1,47 @@
+"""
+Glyph tables for the cell rendering modes.
+
+Every terminal cell covers a small grid of source pixels. A cell is drawn with two colors:
+the pixels set in the cell's bit mask use the foreground color, the others the background color.
+Bit i of the mask is pixel i of the cell in row-major order.
+"""
+
+GLYPH_MODES = ('half', 'quadrant', 'sextant')
+
+# (pixel rows, pixel columns) covered by one terminal cell
+CELL_SHAPES = {
+    'half': (2, 1),
+    'quadrant': (2, 2),
+    'sextant': (3, 2),
+}
+
+# Masks 1..15 in row-major bit order (top left, top right, bottom left, bottom right)
+_QUADRANT_CHARS = ' ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█'
+
+def _sextant_char(mask: int) -> str:
+    """Returns the character for a sextant mask (top left, top right, middle left, ... bottom right)."""
+    if mask == 0:
+        return ' '
+    if mask == 63:
+        return '█'
+    # The left and right half blocks already exist, so the sextant block skips them
+    if mask == 21:
+        return '▌'
+    if mask == 42:
+        return '▐'
+    return chr(0x1FB00 + mask - 1 - (mask > 21) - (mask > 42))
+
+def _build_table(mode: str) -> list[bytes]:
+    """Returns the pre-encoded glyph for every mask of the given mode."""
+    if mode == 'half':
+        chars = ' ▀▄█'
+    elif mode == 'quadrant':
+        chars = _QUADRANT_CHARS
+    elif mode == 'sextant':
+        chars = [_sextant_char(mask) for mask in range(64)]
+    else:
+        raise ValueError(f"Unknown glyph mode '{mode}', expected one of {', '.join(GLYPH_MODES)}.")
+    return [char.encode('utf-8') for char in chars]
+
+# Pre-encode all glyphs to avoid doing it millions of times
+GLYPH_TABLES = {mode: _build_table(mode) for mode in GLYPH_MODES}
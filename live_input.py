@@ -0,0 +1,322 @@
+"""
+Low-latency playback of live sources: stdin, named pipes and stream URLs.
+
+Live sources can't be probed or seeked and have no frame count, and every frame buffered ahead
+adds to the latency. A reader thread in the producer keeps only the newest decoded frame and
+drops the ones the encoder didn't get to, and the pool holds only a few encoded frames.
+"""
+
+import collections
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import terminal_api
+import daemon_helper
+import renderer
+import video_decoder
+
+# Encoded frames the producer may buffer ahead of the terminal
+DEFAULT_LIVE_BUFFERS = 2
+
+# Put on the ready queue before every frame, with the time the source frame arrived
+TIMESTAMP_MARKER = 'timestamp'
+
+# Counters of the live producer, in shared memory order
+LIVE_STAT_FIELDS = video_decoder.PRODUCER_STAT_FIELDS + ('frames_dropped',)
+
+# Keep FFmpeg from buffering input while probing and demuxing
+_FFMPEG_LOW_DELAY_OPTIONS = 'fflags;nobuffer|flags;low_delay'
+
+# Frames whose timestamps are this much behind the wall clock re-anchor the timeline
+_MAX_LATE = 0.05
+
+def resolve_source(source: str) -> str:
+    """Maps '-' to stdin. Named pipes and stream URLs are opened as they are."""
+    return 'pipe:0' if source == '-' else source
+
+class _LatestFrame:
+    """
+    Reads a capture in a background thread and keeps only the newest frame.
+
+    Frames are released when their input timestamp is due, so sources that deliver faster
+    than real time (e.g. a file piped to stdin) still play at their own pace.
+    Frames that are replaced before the encoder takes them count as dropped.
+    """
+
+    def __init__(self, cap: cv2.VideoCapture):
+        self.cap = cap
+        self.condition = threading.Condition()
+        self.frame = None
+        self.arrival_time = 0.0
+        self.finished = False
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+
+    def _read_loop(self):
+        base_time = None
+        base_pts = 0.0
+        prev_pts = -1.0
+        try:
+            while not self.finished:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+
+                # Pace by the input timestamps. Sources without usable timestamps are shown as they arrive.
+                pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                now = time.time()
+                if pts > prev_pts:
+                    if base_time is None:
+                        base_time, base_pts = now, pts
+                    due_time = base_time + pts - base_pts
+                    if due_time > now:
+                        time.sleep(due_time - now)
+                    elif due_time < now - _MAX_LATE:
+                        # The source fell behind: re-anchor the timeline instead of rushing to catch up
+                        base_time, base_pts = now, pts
+                prev_pts = pts
+
+                with self.condition:
+                    if self.frame is not None:
+                        self.dropped += 1
+                    self.frame = frame
+                    self.arrival_time = time.time()
+                    self.condition.notify()
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify()
+
+    def get(self):
+        """
+        Waits for a frame newer than the last one taken.
+
+        Returns:
+            A tuple (frame, arrival time), or None once the source ended.
+        """
+        with self.condition:
+            while self.frame is None and not self.finished:
+                self.condition.wait()
+            if self.frame is None:
+                return None
+            frame, self.frame = self.frame, None
+            return frame, self.arrival_time
+
+    def stop(self):
+        with self.condition:
+            self.finished = True
+        self.thread.join(timeout=1.0)
+
+def _live_producer_process(source: str, resolution: int,
+                           shm_name: str, buffer_size: int,
+                           free_queue: multiprocessing.Queue, ready_queue: multiprocessing.Queue,
+                           compression: int, glyph_mode: str = 'half', perceptual: bool = False,
+                           shared_stats=None):
+    """
+    Standalone function to run in a separate process.
+    Encodes the newest frame of a live source whenever the pool has room for it.
+    Every frame is preceded by (TIMESTAMP_MARKER, arrival time) on the ready queue.
+    The counters are published to shared_stats, in the order of LIVE_STAT_FIELDS.
+    """
+    # The consumer stops the producer with the sentinel, so Ctrl+C must not interrupt its cleanup
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', _FFMPEG_LOW_DELAY_OPTIONS)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        video_decoder._finish_producer(shm, ready_queue)
+        return
+
+    latest = _LatestFrame(cap)
+    encoder = None
+    resized = None
+    stopped = False
+
+    try:
+        while True:
+            item = latest.get()
+            if item is None:
+                break
+            frame, arrival_time = item
+
+            if encoder is None:
+                # The geometry is only known once the first frame arrived
+                height, width = frame.shape[:2]
+                encoder = renderer.TerminalRenderer(int(resolution * width / height), resolution // 2,
+                                                    compression, glyph_mode, perceptual=perceptual)
+                resized = np.empty((encoder.frame_size[1], encoder.frame_size[0], 3), dtype=np.uint8)
+
+            cv2.resize(frame, encoder.frame_size, dst=resized, interpolation=cv2.INTER_LINEAR)
+            buffer = encoder.render(resized)
+
+            if shared_stats is not None:
+                for i, field in enumerate(video_decoder.PRODUCER_STAT_FIELDS):
+                    shared_stats[i] = encoder.stats[field]
+                shared_stats[len(video_decoder.PRODUCER_STAT_FIELDS)] = latest.dropped
+
+            ready_queue.put((TIMESTAMP_MARKER, arrival_time))
+            if not video_decoder._send_to_shm(shm, buffer, buffer_size, free_queue, ready_queue):
+                stopped = True
+                break
+
+    except Exception:
+        pass
+    finally:
+        latest.stop()
+        if not latest.thread.is_alive():
+            # Don't release the capture under a read that is still blocked on the source
+            cap.release()
+        video_decoder._finish_producer(shm, ready_queue, stopped)
+
+class LiveDecoder:
+    """
+    Decodes a live source with a shallow buffer.
+
+    Args:
+        source: '-' for stdin, the path of a named pipe, or a stream URL.
+        resolution: The size of the video element.
+        compression: The threshold for color change detection.
+        glyph_mode: How source pixels are packed into cells (see glyphs.GLYPH_MODES).
+        perceptual: Whether to use the perceptual per-cell thresholds.
+        num_buffers: Encoded frames the producer may buffer ahead (1 to 3 keeps the latency low).
+    """
+
+    def __init__(self, source: str, resolution: int, compression: int = 150, glyph_mode: str = 'half',
+                 perceptual: bool = False, num_buffers: int = DEFAULT_LIVE_BUFFERS,
+                 buffer_size: int = video_decoder.DEFAULT_BUFFER_SIZE):
+        if num_buffers < 1:
+            raise ValueError("A live decoder needs at least one buffer.")
+
+        self.source = resolve_source(source)
+        self.resolution = resolution if resolution % 2 == 0 else resolution + 1
+        self.compression = compression
+        self.glyph_mode = glyph_mode
+        self.perceptual = perceptual
+        self.num_buffers = num_buffers
+        self.buffer_size = buffer_size
+
+        self.shared_stats = multiprocessing.Array('q', len(LIVE_STAT_FIELDS), lock=False)
+        # The video_decoder.FramePool of the running diff_frame_generator
+        self.pool = None
+
+    def get_producer_stats(self) -> dict:
+        return dict(zip(LIVE_STAT_FIELDS, self.shared_stats))
+
+    def get_buffered_frame_count(self) -> int:
+        # Every frame is preceded by its timestamp
+        return self.pool.get_ready_count() // 2 if self.pool is not None else 0
+
+    def diff_frame_generator(self):
+        """Starts the producer process and yields (data, arrival time) for every encoded frame."""
+        self.pool = video_decoder.FramePool(self.buffer_size, self.num_buffers)
+        self.pool.start(_live_producer_process, self.source, self.resolution,
+                        compression=self.compression, glyph_mode=self.glyph_mode, perceptual=self.perceptual,
+                        shared_stats=self.shared_stats)
+
+        arrival_time = 0.0
+        chunks = []
+
+        try:
+            while True:
+                item = self.pool.get()
+                if item is None:
+                    break
+
+                if item[0] == TIMESTAMP_MARKER:
+                    arrival_time = item[1]
+                    continue
+
+                idx, size, _, is_last_chunk, _ = item
+                chunks.append(self.pool.read(idx, size))
+
+                if is_last_chunk:
+                    yield b''.join(chunks), arrival_time
+                    chunks = []
+
+        finally:
+            self.pool.close()
+
+def _play_live(decoder: LiveDecoder, debug_mode: bool, latencies: collections.deque):
+    """Writes every frame as soon as it arrives and records the input-to-display latency in latencies."""
+    frames_shown = 0
+    pending = []
+    # Arrival and display time of the previous frame shown, for the playback speed
+    last_arrival_time = None
+    last_display_time = None
+
+    generator = decoder.diff_frame_generator()
+    try:
+        for data, arrival_time in generator:
+            pending.append(data)
+            if decoder.get_buffered_frame_count() > 0:
+                # A newer frame is already waiting. Diffs are cumulative, so write both at once
+                # instead of showing this one late.
+                continue
+
+            data = b''.join(pending)
+            pending = []
+            terminal_api.print_at_bytes((0, 0), data)
+            frames_shown += 1
+
+            # From the source frame arriving at the decoder to its diff being written to the terminal
+            display_time = time.time()
+            latencies.append(display_time - arrival_time)
+
+            # Source time shown per wall clock time, 1.0 while the display keeps up with the input
+            playback_speed = 1.0
+            if last_display_time is not None and display_time > last_display_time:
+                playback_speed = (arrival_time - last_arrival_time) / (display_time - last_display_time)
+            last_arrival_time = arrival_time
+            last_display_time = display_time
+
+            if debug_mode and daemon_helper.daemon_manager:
+                producer_stats = decoder.get_producer_stats()
+                producer_stats['latency_ms'] = round(latencies[-1] * 1000, 1)
+                producer_stats['mean_latency_ms'] = round(sum(latencies) / len(latencies) * 1000, 1)
+                daemon_helper.daemon_manager.update_daemon(
+                    frames_shown=frames_shown,
+                    total_frames=0,
+                    frames_buffered=decoder.get_buffered_frame_count(),
+                    data_throughput=len(data) / 1024,
+                    playback_speed=playback_speed,
+                    producer_stats=producer_stats
+                )
+    finally:
+        generator.close()
+
+def play_live(terminal, source: str, size: int = 32, debug_mode: bool = False, compression: int = 150,
+              glyph_mode: str = 'half', perceptual: bool = False, num_buffers: int = DEFAULT_LIVE_BUFFERS):
+    """
+    Plays a live source with low latency. Audio is not played in live mode.
+
+    Args:
+        terminal (Terminal): The terminal object used to clear the screen.
+        source: '-' for stdin, the path of a named pipe, or a stream URL.
+        size: The size of the video element.
+        debug_mode: Whether to send statistics to the debug terminal.
+        compression: The threshold for color change detection.
+        glyph_mode: How source pixels are packed into cells (see glyphs.GLYPH_MODES).
+        perceptual: Whether to use the perceptual per-cell thresholds.
+        num_buffers: Encoded frames the producer may buffer ahead.
+    """
+    decoder = LiveDecoder(source, size, compression, glyph_mode, perceptual, num_buffers)
+
+    # Latencies of the most recent frames
+    latencies = collections.deque(maxlen=300)
+    with terminal_api.playback_session(terminal, debug_mode):
+        _play_live(decoder, debug_mode, latencies)
+
+    if latencies:
+        print(f"Input to display latency: mean {sum(latencies) / len(latencies) * 1000:.1f} ms, "
+              f"max {max(latencies) * 1000:.1f} ms over the last {len(latencies)} frames, "
+              f"{decoder.get_producer_stats()['frames_dropped']} source frames dropped")
@@ -5,11 +5,18 @@ import time
 import os
 
 from blessed import Terminal
-from ffpyplayer.player import MediaPlayer
 
 import terminal_api
 import daemon_helper
 import video_decoder
+import glyphs
+import mosaic
+import playlist
+import live_input
+import frame_cache
+import resource_monitor
+import audio_process
+import stream_server
 import ffmpeg
 
 terminal = Terminal()
@@ -17,11 +24,37 @@ terminal = Terminal()
 if os.name == 'nt':
     os.system('chcp 65001 >nul')
 
-def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted: bool = False, compression: int = 150):
+# Playback speeds the speed keys step through
+SPEED_STEPS = (0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 4.0, 8.0, 16.0)
+SPEED_UP_KEYS = ('+', ']')
+SPEED_DOWN_KEYS = ('-', '[')
+SPEED_RESET_KEYS = ('1',)
+
+def _read_speed_key(speed: float) -> float:
+    """Returns the playback speed after the speed key pressed since the last frame, if any."""
+    key = terminal.inkey(timeout=0)
+    if key in SPEED_UP_KEYS:
+        return next((step for step in SPEED_STEPS if step > speed), speed)
+    if key in SPEED_DOWN_KEYS:
+        return next((step for step in reversed(SPEED_STEPS) if step < speed), speed)
+    if key in SPEED_RESET_KEYS:
+        return 1.0
+    return speed
+
+def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted: bool = False, compression: int = 150,
+                glyph_mode: str = 'half', perceptual: bool = False, cache: frame_cache.FrameCache | None = None,
+                max_interlace: int = 1, speed: float = 1.0, monitor: resource_monitor.ResourceMonitor | None = None):
     decoder = video_decoder.VideoDecoder(
         file_path,
         size,
-        compression
+        compression,
+        glyph_mode=glyph_mode,
+        scroll=True,
+        perceptual=perceptual,
+        frame_cache=cache,
+        speed=speed,
+        # With degradation, interlace level changes have to show before the terminal falls further behind
+        num_buffers=video_decoder.DEGRADE_NUM_BUFFERS if max_interlace > 1 else video_decoder.DEFAULT_NUM_BUFFERS
     )
     
     probe = ffmpeg.probe(file_path)
@@ -31,7 +64,8 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
 
     player = None
     if not muted:
-        player = MediaPlayer(file_path, ff_opts={'vn': True, 'sn': True}, loglevel='quiet')
+        # Audio plays in its own process, so its threads don't compete with the render loop for the GIL
+        player = audio_process.AudioPlayer(file_path)
 
     diff_generator = decoder.diff_frame_generator()
 
@@ -42,6 +76,9 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
     # Track pause state to avoid spamming the player
     is_paused = False
 
+    # Degrades to interlaced row updates while the terminal can't keep up
+    degradation = video_decoder.DegradationController(max_interlace) if max_interlace > 1 else None
+
     # Start the generator
     try:
         frame = next(diff_generator)
@@ -50,11 +87,25 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
             player.close_player()
         return
 
-    frame_idx = 0
+    if monitor:
+        # The producer runs once the first frame was requested
+        monitor.add_process('producer', decoder.pool.process.pid)
+        monitor.add_pool('shm', decoder.get_shm_bytes_in_use, decoder.get_shm_capacity())
+        if player:
+            monitor.add_process('audio', player.process.pid)
+
+    # Audio only plays at normal speed
+    if player and speed != 1.0:
+        player.set_pause(True)
+        is_paused = True
+
+    position = decoder.get_position()
     
     # Track start time for wall-clock fallback
     # Moved here so we don't count the time it took to load the first frame as "lag"
+    # The wall clock runs from start_pts of the source at the current speed
     start_time = time.time()
+    start_pts = position * frame_time
 
     try:
         while True:
@@ -66,13 +117,32 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
             # Get next frame immediately. This includes decoding time.
             try:
                 frame = diff_generator.send(True)
-                frame_idx += 1
             except StopIteration:
                 break
 
+            new_speed = _read_speed_key(speed)
+            if new_speed != speed:
+                decoder.set_speed(new_speed)
+                if degradation:
+                    degradation.notify_flush()
+                if player and new_speed == 1.0:
+                    # Resume the audio where the video is
+                    player.seek(decoder.get_position() * frame_time, relative=False)
+                    player.set_pause(False)
+                    is_paused = False
+                elif player and speed == 1.0:
+                    player.set_pause(True)
+                    is_paused = True
+                speed = new_speed
+                start_time = time.time()
+                start_pts = decoder.get_position() * frame_time
+
             # Sync Logic
-            video_pts = frame_idx * frame_time
-            audio_pts = player.get_pts() if player else None
+            # Timestamps are in source time, skipped frames included
+            last_position = position
+            position = decoder.get_position()
+            video_pts = position * frame_time
+            audio_pts = player.get_pts() if player and speed == 1.0 else None
 
             if audio_pts is not None:
                 drift = video_pts - audio_pts
@@ -95,8 +165,8 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
                         player.set_pause(False)
                         is_paused = False
             else:
-                # Fallback: Audio not ready yet or finished. Sync to wall clock.
-                target_time = start_time + (frame_idx * frame_time)
+                # Fallback: Audio not ready yet, finished or not playing at this speed. Sync to wall clock.
+                target_time = start_time + (video_pts - start_pts) / speed
                 current_time = time.time()
                 sleep_time = target_time - current_time
                 if sleep_time > 0.005:
@@ -105,17 +175,30 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
                     # We are behind by more than 200ms. 
                     # Instead of fast-forwarding to catch up, we reset the timeline.
                     # This effectively "drops" the time we lost.
-                    start_time = current_time - (frame_idx * frame_time)
+                    start_time = current_time - (video_pts - start_pts) / speed
+
+            frame_end_time = time.time()
+            # Relative to the requested speed, so 1.0 means on time at any speed
+            playback_speed = (position - last_position) * frame_time / (frame_end_time - frame_start_time) / speed
+
+            if degradation:
+                decoder.set_interlace(degradation.update(decoder.get_buffered_frame_count(), playback_speed))
 
             if debug_mode and daemon_helper.daemon_manager:
-                frame_end_time = time.time()
                 # Calculate stats
+                producer_stats = decoder.get_producer_stats()
+                if degradation:
+                    producer_stats['interlace_requested'] = degradation.level
+                    producer_stats['interlace_changes'] = degradation.level_changes
+                producer_stats['speed'] = speed
                 daemon_helper.daemon_manager.update_daemon(
-                    frames_shown=frame_idx,
+                    frames_shown=position,
                     total_frames=frame_amount,
                     frames_buffered=decoder.get_buffered_frame_count(),
                     data_throughput=len(frame) / 1024,
-                    playback_speed= 1.0 / (frame_end_time - frame_start_time) / frame_rate
+                    playback_speed=playback_speed,
+                    producer_stats=producer_stats,
+                    resource_stats=monitor.get_stats() if monitor else None
                 )
     finally:
         # Mute immediately to stop any buffered audio from playing
@@ -124,44 +207,98 @@ def _play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted:
             player.set_pause(True)
             player.close_player()
 
-def play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted: bool = False, compression: int = 150):
-    terminal_api.clear_screen(terminal)
-    terminal_api.hide_cursor()
+def play_video(file_path: str, size: int = 32, debug_mode: bool = False, muted: bool = False, compression: int = 150,
+               glyph_mode: str = 'half', perceptual: bool = False, cache: frame_cache.FrameCache | None = None,
+               max_interlace: int = 1, speed: float = 1.0, monitor_resources: bool = False):
+    monitor = None
+    if monitor_resources:
+        monitor = resource_monitor.ResourceMonitor()
+        monitor.add_process('player', os.getpid())
+        monitor.start()
     
+    try:
+        # Unbuffered key presses for the speed keys
+        with terminal_api.playback_session(terminal, debug_mode), terminal.cbreak():
+            _play_video(file_path, size, debug_mode, muted, compression, glyph_mode, perceptual, cache, max_interlace,
+                        speed, monitor)
+    finally:
+        if monitor:
+            monitor.stop()
+
+    if monitor:
+        print(monitor.summary())
+
+def serve_video(file_path: str, address: str, size: int = 32, debug_mode: bool = False, compression: int = 150,
+                glyph_mode: str = 'half', perceptual: bool = False, cache: frame_cache.FrameCache | None = None):
+    """Encodes the video once and streams it to every client connected to address."""
     if debug_mode:
         daemon_helper.start_daemon()
     else:
         logging.getLogger().setLevel(logging.ERROR)
-    
-    try:    
-        _play_video(file_path, size, debug_mode, muted, compression)
 
-    except KeyboardInterrupt:
-        pass
+    decoder = video_decoder.VideoDecoder(file_path, size, compression, glyph_mode=glyph_mode, scroll=True,
+                                         perceptual=perceptual, frame_cache=cache)
+    server = stream_server.StreamServer(decoder, address)
+    print(f"Streaming {file_path} on {server.address}", flush=True)
 
-    except Exception as e:
-        terminal_api.clear_screen(terminal)
-        terminal_api.reset_text_color(terminal)
-        terminal_api.show_cursor()
-        raise Exception(f"\nAn error occurred: {e}")
-    finally:
-        # Always restore terminal state, even if interrupted or exception occurred
-        terminal_api.reset_text_color(terminal)
-        terminal_api.show_cursor()
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.close()
 
-    # Avoid clearing the error message
-    terminal_api.clear_screen(terminal)
+def connect(address: str):
+    """Plays the stream of a server started with --serve."""
+    with terminal_api.playback_session(terminal):
+        stream_server.run_client(address)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Play a video in the terminal.")
-    parser.add_argument("file_path", help="The path to the video file.")
+    parser.add_argument("file_path", nargs="*", help="The path to the video file. Pass several paths to play them as a mosaic.")
     parser.add_argument("--size", type=int, default=32, help="The size of the video element.")
     parser.add_argument("--debug", action="store_true", help="Open debug terminal and run with profiler.")
     parser.add_argument("--muted", action="store_true", help="Mute the audio.")
     parser.add_argument("--compression", type=int, default=150, help="The threshold for color change detection (default: 150).")
+    parser.add_argument("--glyphs", choices=glyphs.GLYPH_MODES, default="half", help="How many source pixels are packed into one cell: half (1x2), quadrant (2x2) or sextant (2x3) (default: half).")
+    parser.add_argument("--perceptual", action="store_true", help="Use per-cell thresholds from local luminance and texture, and only resend cells that change consistently.")
+    parser.add_argument("--playlist", action="store_true", help="Play the videos one after another without gaps instead of as a mosaic. Directories are expanded to the videos they contain.")
+    parser.add_argument("--loop", action="store_true", help="Play the videos as a playlist and start over after the last one.")
+    parser.add_argument("--live", action="store_true", help="Play a live source with low latency: '-' for stdin, a named pipe or a stream URL.")
+    parser.add_argument("--live-buffers", type=int, choices=[1, 2, 3], default=live_input.DEFAULT_LIVE_BUFFERS, help="Frames buffered ahead in live mode (default: 2).")
+    parser.add_argument("--degrade", type=int, nargs="?", const=2, default=1, metavar="N", help="When the terminal can't keep up, update only every N-th row per frame, in turns (default N: 2). Full updates resume when it catches up.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed, e.g. 0.5 or 4. Change it while playing with + and - (or ] and [), 1 resets it. Audio only plays at 1x (default: 1).")
+    parser.add_argument("--monitor", action="store_true", help="Sample CPU, memory and context switches of the player, decoder and audio processes and the shared memory in use, show them in debug mode and print a summary on exit.")
+    parser.add_argument("--cache", action="store_true", help="Keep decoded and resized frames in an on-disk cache and play from it when available.")
+    parser.add_argument("--cache-dir", default=frame_cache.DEFAULT_CACHE_DIR, help="Where the frame cache is stored.")
+    parser.add_argument("--cache-budget", type=int, default=frame_cache.DEFAULT_CACHE_BUDGET // (1024 * 1024), help="Disk space of the frame cache in MB; least recently used videos are evicted (default: 4096).")
+    parser.add_argument("--grid", default=None, help="Mosaic grid layout as COLSxROWS (default: chosen from the number of videos).")
+    parser.add_argument("--serve", metavar="ADDRESS", default=None, help="Stream the video to clients on host:port, port or unix:/path instead of playing it.")
+    parser.add_argument("--connect", metavar="ADDRESS", default=None, help="Play the stream of a server started with --serve.")
     args = parser.parse_args()
 
-    if args.debug:
-        cProfile.run('play_video(args.file_path, args.size, args.debug, args.muted, args.compression)')
+    if args.speed <= 0:
+        parser.error("--speed must be greater than 0")
+
+    cache = frame_cache.FrameCache(args.cache_dir, args.cache_budget * 1024 * 1024) if args.cache else None
+
+    if args.connect:
+        connect(args.connect)
+    elif not args.file_path:
+        parser.error("the following arguments are required: file_path")
+    elif args.serve:
+        serve_video(args.file_path[0], args.serve, args.size, args.debug, args.compression, args.glyphs, args.perceptual, cache)
+    elif args.live:
+        live_input.play_live(terminal, args.file_path[0], args.size, args.debug, args.compression, args.glyphs, args.perceptual, args.live_buffers)
+    elif args.playlist or args.loop or any(os.path.isdir(path) for path in args.file_path):
+        if args.debug:
+            cProfile.run('playlist.play_playlist(terminal, args.file_path, args.loop, args.size, args.debug, args.compression, args.glyphs, args.perceptual)')
+        else:
+            playlist.play_playlist(terminal, args.file_path, args.loop, args.size, args.debug, args.compression, args.glyphs, args.perceptual)
+    elif len(args.file_path) > 1 or args.grid:
+        if args.debug:
+            cProfile.run('mosaic.play_mosaic(terminal, args.file_path, args.grid, args.size, args.debug, args.compression, args.glyphs, args.perceptual, cache)')
+        else:
+            mosaic.play_mosaic(terminal, args.file_path, args.grid, args.size, args.debug, args.compression, args.glyphs, args.perceptual, cache)
+    elif args.debug:
+        cProfile.run('play_video(args.file_path[0], args.size, args.debug, args.muted, args.compression, args.glyphs, args.perceptual, cache, args.degrade, args.speed, args.monitor)')
     else:
-        play_video(args.file_path, args.size, args.debug, args.muted, args.compression)
+        play_video(args.file_path[0], args.size, args.debug, args.muted, args.compression, args.glyphs, args.perceptual, cache, args.degrade, args.speed, args.monitor)
@@ -0,0 +1,221 @@
+import math
+import os
+import time
+
+import terminal_api
+import daemon_helper
+import video_decoder
+
+# Tiles are small, so they get a much smaller shared memory pool than a full screen video.
+# 1MB * 64 buffers = 64MB per tile instead of 2GB.
+TILE_BUFFER_SIZE = 1 * 1024 * 1024
+TILE_NUM_BUFFERS = 64
+
+# Gap in cells between neighbouring tiles
+TILE_GAP = 1
+
+def parse_grid(grid: str | None, tile_count: int) -> tuple[int, int]:
+    """
+    Parses a grid layout in the form 'COLSxROWS'.
+    If no grid is given, the smallest square-ish grid that fits all tiles is used.
+
+    Returns:
+        A tuple (columns, rows).
+    """
+    if not grid:
+        columns = math.ceil(math.sqrt(tile_count))
+        rows = math.ceil(tile_count / columns)
+        return columns, rows
+
+    try:
+        columns, rows = (int(part) for part in grid.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"Invalid grid layout '{grid}', expected the form COLSxROWS (e.g. 2x2).")
+
+    if columns < 1 or rows < 1:
+        raise ValueError(f"Invalid grid layout '{grid}', columns and rows must be positive.")
+    if columns * rows < tile_count:
+        raise ValueError(f"Grid {columns}x{rows} has room for {columns * rows} tiles, but {tile_count} videos were given.")
+
+    return columns, rows
+
+def layout_tiles(frame_sizes: list[tuple[int, int]], columns: int) -> list[tuple[int, int]]:
+    """
+    Computes the top left cell of every tile.
+    Each grid column is as wide as its widest tile and each grid row as tall as its tallest tile.
+
+    Args:
+        frame_sizes: The (columns, rows) in cells of every tile, in grid order.
+        columns: The number of columns of the grid.
+
+    Returns:
+        A list of (x, y) origins, one per tile.
+    """
+    grid_rows = math.ceil(len(frame_sizes) / columns)
+    column_widths = [0] * columns
+    row_heights = [0] * grid_rows
+
+    for i, (width, height) in enumerate(frame_sizes):
+        column_widths[i % columns] = max(column_widths[i % columns], width)
+        row_heights[i // columns] = max(row_heights[i // columns], height)
+
+    column_offsets = [sum(column_widths[:c]) + c * TILE_GAP for c in range(columns)]
+    row_offsets = [sum(row_heights[:r]) + r * TILE_GAP for r in range(grid_rows)]
+
+    return [(column_offsets[i % columns], row_offsets[i // columns]) for i in range(len(frame_sizes))]
+
+class _Tile:
+    """Playback state of a single tile."""
+
+    def __init__(self, decoder: video_decoder.VideoDecoder):
+        self.decoder = decoder
+        self.name = os.path.basename(decoder.file_path)
+        self.frame_time = 1.0 / decoder.get_frame_rate() if decoder.get_frame_rate() > 0 else 1.0 / 30
+        self.generator = decoder.diff_frame_generator()
+        self.frames_shown = 0
+        self.last_frame_size = 0
+        self.finished = False
+        self.start_time = None
+
+    def collect(self, now: float) -> list[bytes]:
+        """Pulls every frame that is due at the given time. Diffs are cumulative, so none can be dropped."""
+        parts = []
+        if self.finished:
+            return parts
+
+        due = int((now - self.start_time) / self.frame_time) + 1
+        if due - self.frames_shown > 1 and (due - self.frames_shown) * self.frame_time > 0.2:
+            # We are behind by more than 200ms. Reset the timeline instead of fast-forwarding.
+            self.start_time = now - self.frames_shown * self.frame_time
+            due = self.frames_shown + 1
+
+        while self.frames_shown < due:
+            try:
+                parts.append(next(self.generator))
+            except StopIteration:
+                self.finished = True
+                break
+            self.frames_shown += 1
+
+        if parts:
+            self.last_frame_size = sum(len(part) for part in parts)
+        return parts
+
+    def close(self):
+        self.generator.close()
+
+    def get_stats(self) -> dict:
+        return {
+            'name': self.name,
+            'frames_shown': self.frames_shown,
+            'total_frames': self.decoder.get_total_frames(),
+            'frames_buffered': self.decoder.get_buffered_frame_count(),
+            'data_throughput': self.last_frame_size / 1024
+        }
+
+def _play_mosaic(file_paths: list[str], grid: str | None, size: int, debug_mode: bool, compression: int,
+                 glyph_mode: str, perceptual: bool, cache=None):
+    columns, _ = parse_grid(grid, len(file_paths))
+    cpu_count = os.cpu_count() or 1
+
+    decoders = [
+        video_decoder.VideoDecoder(
+            file_path,
+            size,
+            compression,
+            glyph_mode=glyph_mode,
+            perceptual=perceptual,
+            frame_cache=cache,
+            scroll=False,
+            buffer_size=TILE_BUFFER_SIZE,
+            num_buffers=TILE_NUM_BUFFERS
+        )
+        for file_path in file_paths
+    ]
+
+    # Each tile gets its own origin and core
+    origins = layout_tiles([decoder.get_frame_size() for decoder in decoders], columns)
+    for i, (decoder, origin) in enumerate(zip(decoders, origins)):
+        decoder.origin = origin
+        decoder.cpu = i % cpu_count
+
+    tiles = [_Tile(decoder) for decoder in decoders]
+
+    # The writer ticks at the rate of the fastest tile
+    tick_time = min(tile.frame_time for tile in tiles)
+
+    try:
+        # Wait for the first frame of every tile so loading time is not counted as lag
+        first_parts = []
+        for tile in tiles:
+            try:
+                first_parts.append(next(tile.generator))
+                tile.frames_shown = 1
+            except StopIteration:
+                tile.finished = True
+
+        start_time = time.time()
+        for tile in tiles:
+            tile.start_time = start_time
+
+        terminal_api.print_at_bytes((0, 0), b''.join(first_parts))
+
+        tick_idx = 0
+        while not all(tile.finished for tile in tiles):
+            tick_start_time = time.time()
+            tick_idx += 1
+
+            target_time = start_time + tick_idx * tick_time
+            sleep_time = target_time - tick_start_time
+            if sleep_time > 0.005:
+                time.sleep(sleep_time)
+            elif sleep_time < -0.2:
+                start_time = tick_start_time - tick_idx * tick_time
+
+            now = time.time()
+            parts = []
+            for tile in tiles:
+                parts.extend(tile.collect(now))
+
+            # Merge all tile diffs into a single write per display tick
+            data = b''.join(parts)
+            if data:
+                terminal_api.print_at_bytes((0, 0), data)
+
+            if debug_mode and daemon_helper.daemon_manager:
+                tick_end_time = time.time()
+                tile_stats = [tile.get_stats() for tile in tiles]
+                daemon_helper.daemon_manager.update_daemon(
+                    frames_shown=sum(stats['frames_shown'] for stats in tile_stats),
+                    total_frames=sum(stats['total_frames'] for stats in tile_stats),
+                    frames_buffered=min(stats['frames_buffered'] for stats in tile_stats),
+                    data_throughput=len(data) / 1024,
+                    playback_speed=tick_time / max(tick_end_time - tick_start_time, 1e-6),
+                    tile_stats=tile_stats
+                )
+    finally:
+        for tile in tiles:
+            tile.close()
+
+def play_mosaic(terminal, file_paths: list[str], grid: str | None = None, size: int = 32,
+                debug_mode: bool = False, compression: int = 150, glyph_mode: str = 'half',
+                perceptual: bool = False, cache=None):
+    """
+    Plays several videos at once, tiled in a grid. Audio is not played in mosaic mode.
+
+    Args:
+        terminal (Terminal): The terminal object used to clear the screen.
+        file_paths: The videos to play, in grid order (left to right, top to bottom).
+        grid: The grid layout as 'COLSxROWS'. Chosen automatically if None.
+        size: The size of every tile.
+        debug_mode: Whether to send statistics to the debug terminal.
+        compression: The threshold for color change detection.
+        glyph_mode: How source pixels are packed into cells (see glyphs.GLYPH_MODES).
+        perceptual: Whether to use the perceptual per-cell thresholds.
+        cache: An optional frame_cache.FrameCache to read resized frames from.
+    """
+    # Validate the layout before touching the terminal
+    parse_grid(grid, len(file_paths))
+
+    with terminal_api.playback_session(terminal, debug_mode):
+        _play_mosaic(file_paths, grid, size, debug_mode, compression, glyph_mode, perceptual, cache)
@@ -0,0 +1,312 @@
+"""
+Gapless playback of several clips one after another, optionally in a loop.
+
+One producer process and one shared memory pool serve the whole playlist. The producer opens
+and decodes the first frame of the next clip while the current one is still being encoded, and
+keeps encoding ahead across clip boundaries, so the next clip's first frame is already buffered
+when the current clip ends.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import terminal_api
+import daemon_helper
+import renderer
+import video_decoder
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.webm', '.m4v', '.mpg', '.mpeg', '.wmv', '.flv', '.gif')
+
+# Put on the ready queue before the first frame of every clip
+CLIP_MARKER = 'clip'
+
+# Resets the colors and clears the screen when the next clip covers a different area
+_CLEAR_SEQUENCE = b'\x1b[0m\x1b[2J'
+
+def expand_paths(paths: list[str]) -> list[str]:
+    """Replaces every directory in paths with the video files it contains, sorted by name."""
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        else:
+            file_paths.append(path)
+
+    if not file_paths:
+        raise ValueError(f"No video files found in {', '.join(paths)}.")
+    return file_paths
+
+def _open_clip(file_path: str):
+    """
+    Opens a clip and decodes its first frame.
+
+    Returns:
+        A tuple (capture, first frame, frame rate, total frames), or None if the clip can't be read.
+    """
+    cap = cv2.VideoCapture(file_path)
+    ret, frame = cap.read() if cap.isOpened() else (False, None)
+    if not ret:
+        cap.release()
+        return None
+    return cap, frame, cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+def _playlist_producer_process(file_paths: list[str], loop: bool, resolution: int,
+                               shm_name: str, buffer_size: int,
+                               free_queue: multiprocessing.Queue, ready_queue: multiprocessing.Queue,
+                               compression: int, glyph_mode: str = 'half', perceptual: bool = False,
+                               shared_stats=None):
+    """
+    Standalone function to run in a separate process.
+    Decodes the clips in order and puts their byte sequences into shared memory.
+    Every clip starts with (CLIP_MARKER, clip index, frame rate, total frames) on the ready queue.
+    """
+    # The consumer stops the producer with the sentinel, so Ctrl+C must not interrupt its cleanup
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # Opens the next clip in the background while the current one is encoded
+    opener = ThreadPoolExecutor(max_workers=1)
+
+    encoder = None
+    resized = None
+    clip_idx = 0
+    clips_since_frame = 0
+    stopped = False
+
+    try:
+        upcoming = opener.submit(_open_clip, file_paths[0])
+        while True:
+            clip = upcoming.result()
+            current_idx = clip_idx
+            clip_idx += 1
+            if clip_idx == len(file_paths) and loop:
+                clip_idx = 0
+            if clip_idx < len(file_paths):
+                upcoming = opener.submit(_open_clip, file_paths[clip_idx])
+
+            if clip is None:
+                clips_since_frame += 1
+                if clip_idx >= len(file_paths) or clips_since_frame >= len(file_paths):
+                    # End of the playlist, or no clip of a looping playlist can be read
+                    break
+                continue
+            clips_since_frame = 0
+
+            cap, frame, frame_rate, total_frames = clip
+            height, width = frame.shape[:2]
+            # Same geometry as the video decoder: resolution // 2 rows whatever the glyph mode
+            columns, rows = int(resolution * width / height), resolution // 2
+
+            prefix = b''
+            if encoder is None or (encoder.columns, encoder.rows) != (columns, rows):
+                if encoder is not None:
+                    prefix = _CLEAR_SEQUENCE
+                encoder = renderer.TerminalRenderer(columns, rows, compression, glyph_mode, perceptual=perceptual)
+                resized = np.empty((encoder.frame_size[1], encoder.frame_size[0], 3), dtype=np.uint8)
+            # Clips with the same geometry keep diffing against the last frame of the previous clip,
+            # so a switch costs no more than a scene cut
+
+            ready_queue.put((CLIP_MARKER, current_idx, frame_rate, total_frames))
+
+            try:
+                while frame is not None:
+                    cv2.resize(frame, encoder.frame_size, dst=resized, interpolation=cv2.INTER_LINEAR)
+                    buffer = encoder.render(resized)
+                    if prefix:
+                        buffer[:0] = prefix
+                        prefix = b''
+
+                    if shared_stats is not None:
+                        for i, field in enumerate(video_decoder.PRODUCER_STAT_FIELDS):
+                            shared_stats[i] = encoder.stats[field]
+
+                    if not video_decoder._send_to_shm(shm, buffer, buffer_size, free_queue, ready_queue):
+                        stopped = True
+                        return
+
+                    ret, frame = cap.read()
+                    if not ret:
+                        frame = None
+            finally:
+                cap.release()
+
+            if clip_idx >= len(file_paths):
+                break
+
+    except Exception:
+        pass
+    finally:
+        opener.shutdown(wait=True, cancel_futures=True)
+        video_decoder._finish_producer(shm, ready_queue, stopped)
+
+class Playlist:
+    """
+    Decodes a list of clips with a single long-lived producer process and shared memory pool.
+
+    Args:
+        file_paths: The clips to play, in order.
+        resolution: The size of the video element.
+        compression: The threshold for color change detection.
+        loop: Whether to start over after the last clip.
+        glyph_mode: How source pixels are packed into cells (see glyphs.GLYPH_MODES).
+        perceptual: Whether to use the perceptual per-cell thresholds.
+    """
+
+    def __init__(self, file_paths: list[str], resolution: int, compression: int = 150, loop: bool = False,
+                 glyph_mode: str = 'half', perceptual: bool = False,
+                 buffer_size: int = video_decoder.DEFAULT_BUFFER_SIZE,
+                 num_buffers: int = video_decoder.DEFAULT_NUM_BUFFERS):
+        self.file_paths = file_paths
+        self.resolution = resolution if resolution % 2 == 0 else resolution + 1
+        self.compression = compression
+        self.loop = loop
+        self.glyph_mode = glyph_mode
+        self.perceptual = perceptual
+        self.buffer_size = buffer_size
+        self.num_buffers = num_buffers
+
+        self.shared_stats = multiprocessing.Array('q', len(video_decoder.PRODUCER_STAT_FIELDS), lock=False)
+        # The video_decoder.FramePool of the running diff_frame_generator
+        self.pool = None
+
+    def get_producer_stats(self) -> dict:
+        return dict(zip(video_decoder.PRODUCER_STAT_FIELDS, self.shared_stats))
+
+    def get_buffered_frame_count(self) -> int:
+        return self.pool.get_ready_count() if self.pool is not None else 0
+
+    def diff_frame_generator(self):
+        """
+        Starts the producer process and yields (data, clip) for every frame of every clip.
+        clip is a dict with the index, name, frame_rate and total_frames of a clip
+        on its first frame, and None on every other frame.
+        """
+        self.pool = video_decoder.FramePool(self.buffer_size, self.num_buffers)
+        self.pool.start(_playlist_producer_process, self.file_paths, self.loop, self.resolution,
+                        compression=self.compression, glyph_mode=self.glyph_mode, perceptual=self.perceptual,
+                        shared_stats=self.shared_stats)
+
+        clip = None
+
+        try:
+            while True:
+                item = self.pool.get()
+                if item is None:
+                    break
+
+                if item[0] == CLIP_MARKER:
+                    _, clip_idx, frame_rate, total_frames = item
+                    clip = {
+                        'index': clip_idx,
+                        'name': os.path.basename(self.file_paths[clip_idx]),
+                        'frame_rate': frame_rate if frame_rate > 0 else 30.0,
+                        'total_frames': total_frames
+                    }
+                    continue
+
+                idx, size, _, _, _ = item
+                data = self.pool.read(idx, size)
+
+                yield data, clip
+                clip = None
+
+        finally:
+            self.pool.close()
+
+def _play_playlist(playlist: Playlist, debug_mode: bool, switch_latencies: list[float]):
+    """
+    Plays the playlist and appends the switch latency of every clip change to switch_latencies:
+    how late in seconds the first frame of the next clip was shown, compared to when it was due.
+    """
+    logger = logging.getLogger(__name__)
+
+    frame_time = 1.0 / 30
+    total_frames = 0
+    frame_idx = 0
+    start_time = None
+    next_due_time = None
+
+    generator = playlist.diff_frame_generator()
+    try:
+        for data, clip in generator:
+            if clip is not None:
+                if start_time is not None:
+                    # The first frame of the next clip is due one frame after the last frame of this one
+                    switch_latencies.append(max(time.time() - next_due_time, 0.0))
+                    logger.info("Switched to %s in %.1f ms", clip['name'], switch_latencies[-1] * 1000)
+                    start_time = next_due_time
+                frame_time = 1.0 / clip['frame_rate']
+                total_frames = clip['total_frames']
+                frame_idx = 0
+
+            frame_start_time = time.time()
+            if start_time is None:
+                # Don't count the time it took to load the first frame as lag
+                start_time = frame_start_time
+
+            terminal_api.print_at_bytes((0, 0), data)
+            frame_idx += 1
+
+            # Sync to the wall clock, resetting the timeline if we fall behind by more than 200ms
+            next_due_time = start_time + frame_idx * frame_time
+            sleep_time = next_due_time - time.time()
+            if sleep_time > 0.005:
+                time.sleep(sleep_time)
+            elif sleep_time < -0.2:
+                start_time = time.time() - frame_idx * frame_time
+                next_due_time = start_time + frame_idx * frame_time
+
+            if debug_mode and daemon_helper.daemon_manager:
+                producer_stats = playlist.get_producer_stats()
+                producer_stats['clip_switches'] = len(switch_latencies)
+                if switch_latencies:
+                    producer_stats['last_switch_ms'] = round(switch_latencies[-1] * 1000, 1)
+                    producer_stats['max_switch_ms'] = round(max(switch_latencies) * 1000, 1)
+                daemon_helper.daemon_manager.update_daemon(
+                    frames_shown=frame_idx,
+                    total_frames=total_frames,
+                    frames_buffered=playlist.get_buffered_frame_count(),
+                    data_throughput=len(data) / 1024,
+                    playback_speed=frame_time / max(time.time() - frame_start_time, 1e-6),
+                    producer_stats=producer_stats
+                )
+    finally:
+        generator.close()
+
+def play_playlist(terminal, file_paths: list[str], loop: bool = False, size: int = 32, debug_mode: bool = False,
+                  compression: int = 150, glyph_mode: str = 'half', perceptual: bool = False):
+    """
+    Plays clips one after another without gaps. Audio is not played in playlist mode.
+
+    Args:
+        terminal (Terminal): The terminal object used to clear the screen.
+        file_paths: The clips to play. Directories are replaced by the videos they contain.
+        loop: Whether to start over after the last clip.
+        size: The size of the video element.
+        debug_mode: Whether to send statistics to the debug terminal.
+        compression: The threshold for color change detection.
+        glyph_mode: How source pixels are packed into cells (see glyphs.GLYPH_MODES).
+        perceptual: Whether to use the perceptual per-cell thresholds.
+    """
+    # Validate the paths before touching the terminal
+    playlist = Playlist(expand_paths(file_paths), size, compression, loop, glyph_mode, perceptual)
+
+    switch_latencies = []
+    with terminal_api.playback_session(terminal, debug_mode):
+        _play_playlist(playlist, debug_mode, switch_latencies)
+
+    if switch_latencies:
+        print(f"Clip switches: {len(switch_latencies)}, "
+              f"mean latency {sum(switch_latencies) / len(switch_latencies) * 1000:.1f} ms, "
+              f"max {max(switch_latencies) * 1000:.1f} ms")
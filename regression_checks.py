@@ -0,0 +1,115 @@
+"""
+Regression checks of behavior that is easy to break without noticing in the player.
+
+Every check runs on synthetic footage and exits with status 1 on failure.
+
+    python regression_checks.py
+    python regression_checks.py golden
+"""
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+import benchmark
+import renderer
+import stream_server
+import video_decoder
+import virtual_terminal
+
+# Hash prefix of the displayed frames of: python benchmark.py quality --compression 150
+GOLDEN_HASH = 'ffb44e541d77dc69'
+
+def write_synthetic_video(file_path: str, frame_size: tuple[int, int] = (128, 72), frame_count: int = 30,
+                          frame_rate: float = 30.0):
+    """Writes a synthetic pan (see benchmark.synthetic_pan) to a video file the decoder can read."""
+    writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*'MJPG'), frame_rate, frame_size)
+    for frame in benchmark.synthetic_pan(frame_size, frame_count):
+        writer.write(frame)
+    writer.release()
+
+def fail(message: str):
+    print(f"FAILED: {message}")
+    sys.exit(1)
+
+def check_golden():
+    """
+    The displayed frames of benchmark.py quality at the default settings have to match the golden hash,
+    so encoder changes can't change the output unnoticed.
+    """
+    encoder = renderer.TerminalRenderer(64 * 16 // 9, 32)
+    stream = [encoder.render(frame) for frame in benchmark.synthetic_pan(encoder.frame_size)]
+    digest = virtual_terminal.frame_hash(virtual_terminal.replay(stream, encoder.columns, encoder.rows))
+    if not digest.startswith(GOLDEN_HASH):
+        fail(f"Golden hash mismatch: expected {GOLDEN_HASH}, got {digest}")
+    print("golden: OK")
+
+def check_interlace():
+    """
+    With perceptual thresholds and interlaced row updates, the screen has to converge to a static frame
+    after a change that every cell sees, however the hysteresis and the row turns line up.
+    """
+    rng = np.random.default_rng(0)
+    for level in (1, 2, 3):
+        encoder = renderer.TerminalRenderer(16, 8, perceptual=True)
+        encoder.interlace = level
+        width, height = encoder.frame_size
+        texture = rng.integers(0, 200, size=(height, width, 3), dtype=np.uint8)
+        stream = [encoder.render(texture)] + [encoder.render(texture + 40) for _ in range(4 * level + 4)]
+        *_, image = virtual_terminal.replay(stream, encoder.columns, encoder.rows)
+        if not np.array_equal(image, texture + 40):
+            stale = np.count_nonzero(np.any(image != texture + 40, axis=2))
+            fail(f"{stale} pixels didn't converge to the static frame at interlace level {level}.")
+    print("interlace: OK")
+
+def check_stream():
+    """
+    Streams a video over loopback TCP to one client. The client has to receive a full redraw
+    first and then the diffs, so its screen ends up showing the same image as a local player.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = os.path.join(temp_dir, 'synthetic.avi')
+        write_synthetic_video(video_path)
+        decoder = video_decoder.VideoDecoder(video_path, 16, keyframe_interval=10)
+        columns, rows = decoder.get_frame_size()
+        expected = virtual_terminal.VirtualTerminal(columns, rows)
+        for data in decoder.diff_frame_generator():
+            expected.feed(data)
+
+        server = stream_server.StreamServer(video_decoder.VideoDecoder(video_path, 16, keyframe_interval=10))
+        received = bytearray()
+        with socket.create_connection(stream_server.parse_address(server.address)[1], timeout=10.0) as client:
+            server_thread = threading.Thread(target=server.serve, daemon=True)
+            server_thread.start()
+            while data := client.recv(1024 * 1024):
+                received += data
+        server_thread.join(timeout=10.0)
+
+    if not received:
+        fail("The client received nothing.")
+    screen = virtual_terminal.VirtualTerminal(columns, rows)
+    screen.feed(received)
+    if not np.array_equal(expected.get_image(), screen.get_image()):
+        fail("The streamed screen differs from the locally played one.")
+    print(f"stream: OK ({len(received)} bytes received)")
+
+CHECKS = {
+    'golden': check_golden,
+    'interlace': check_interlace,
+    'stream': check_stream,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run regression checks of the player.")
+    parser.add_argument("check", nargs="?", choices=[*CHECKS, "all"], default="all",
+                        help="The check to run (default: all).")
+    args = parser.parse_args()
+
+    for name in CHECKS if args.check == "all" else [args.check]:
+        CHECKS[name]()
@@ -0,0 +1,641 @@
+"""
+Turns frames into the terminal escape sequences that update the screen from its last state.
+
+TerminalRenderer is the hot path shared by every producer, and can be used directly to show
+frames generated in Python (dashboards, simulations) in the terminal:
+
+    renderer = TerminalRenderer(columns=80, rows=24)
+    while True:
+        renderer.write(draw_frame()) # (48, 80, 3) uint8 BGR
+"""
+
+import cv2
+import numpy as np
+
+from terminal_api import get_move_sequence_bytes, write_all
+from constants import PERCEPTUAL_WEIGHT_BLUE, PERCEPTUAL_WEIGHT_GREEN, PERCEPTUAL_WEIGHT_RED
+from glyphs import CELL_SHAPES, GLYPH_TABLES
+
+# Perceptual weights for BGR: Blue, Green, Red
+# This matches human eye perception (Luma) to prioritize Green/Brightness changes
+# and ignore subtle Blue/Red noise.
+PERCEPTUAL_WEIGHTS = np.array([PERCEPTUAL_WEIGHT_BLUE, PERCEPTUAL_WEIGHT_GREEN, PERCEPTUAL_WEIGHT_RED], dtype=np.int16)
+
+# Fraction of changed cells above which a frame is treated as a scene cut and redrawn in full
+SCENE_CUT_THRESHOLD = 0.7
+
+# Fraction of changed cells above which the producer checks whether the content scrolled
+SCROLL_CHECK_THRESHOLD = 0.3
+# Mean luminance difference per cell up to which shifted content counts as a match
+SCROLL_MAX_ERROR = 4.0
+
+# Perceptual threshold model: the threshold of every cell is scaled by how visible a change is there.
+# Changes are least visible near black and in bright areas (U-shaped, Weber-like luminance masking)
+# and in textured areas (contrast masking by the local standard deviation of luminance).
+DARK_LEVEL = 64
+DARK_MASKING = 1.0
+MASKING_STD = 16.0
+# A cell has to exceed its threshold this many frames in a row before it is resent,
+# unless it exceeds it by STRONG_CHANGE_FACTOR. Flickering noise rarely does either.
+HYSTERESIS_FRAMES = 2
+STRONG_CHANGE_FACTOR = 2.0
+
+# Estimated bytes of the escape sequences, used to choose between sparse updates and full row rewrites
+MOVE_BYTES = 8 # '\x1b[12;34H'
+CELL_BYTES = 37 # Foreground and background SGR plus the glyph
+GLYPH_BYTES = 3 # Cell with the same colors as its left neighbour: only the glyph
+
+# Counters of every renderer, published by the producers to the consumer through shared memory
+# interlace is the current interlace level rather than a counter
+STAT_FIELDS = ('frames_encoded', 'cut_frames', 'rows_rewritten', 'row_bytes_saved', 'scroll_frames',
+               'interlaced_frames', 'interlace')
+
+def _cluster_cells(pixels: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reduces the pixels of every cell to a foreground color, a background color and a glyph mask.
+    The foreground always covers the first (top left) pixel, so the mask is 0 for solid cells.
+
+    Args:
+        pixels: The pixels of every cell (Cells, Pixels_per_cell, 3_colors) in BGR.
+
+    Returns:
+        A tuple (foreground, background, mask) with the colors in RGB.
+    """
+    if pixels.shape[1] == 2:
+        # Half blocks: two pixels need no clustering, the colors are exact
+        fg = pixels[:, 0, ::-1]
+        bg = pixels[:, 1, ::-1]
+        # Optimization: Vectorized check for solid blocks (Top Color == Bottom Color)
+        # This moves the comparison out of the slow Python loop
+        mask = np.where(np.all(fg == bg, axis=1), 0, 1)
+        return fg, bg, mask
+
+    # Widen so the color sums can't overflow
+    pixels = pixels.astype(np.int32)
+
+    # Split every cell at its mean luminance into a bright and a dark cluster
+    luminance = pixels @ PERCEPTUAL_WEIGHTS
+    selected = luminance > luminance.mean(axis=1, keepdims=True)
+    # Flip the clusters so the foreground covers the first pixel
+    selected ^= ~selected[:, :1]
+
+    fg_count = selected.sum(axis=1)
+    bg_count = pixels.shape[1] - fg_count
+    is_solid = bg_count == 0
+
+    fg_sum = np.einsum('np,npc->nc', selected, pixels)
+    bg_sum = pixels.sum(axis=1) - fg_sum
+    fg = fg_sum // fg_count[:, None]
+    # Solid cells are drawn with the background color only
+    bg = np.where(is_solid[:, None], fg, bg_sum // np.maximum(bg_count, 1)[:, None])
+
+    mask = selected @ (1 << np.arange(pixels.shape[1]))
+    mask[is_solid] = 0
+    return fg[:, ::-1], bg[:, ::-1], mask
+
+def _encode_cells(blocks: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                  move_sequences: list, use_newline: bool, glyph_table: list[bytes]) -> bytearray:
+    """
+    Encodes the given cells of a block grid into terminal escape sequences.
+
+    Args:
+        blocks: The block grid (Rows, Cell_height, Columns, Cell_width, 3_colors) in uint8 BGR.
+        rows: Row index of every cell to draw, sorted by row, then column.
+        cols: Column index of every cell to draw.
+        move_sequences: Pre-computed cursor moves, indexed [y][x].
+        use_newline: Whether '\\r\\n' may be used to move to the start of the next row.
+        glyph_table: The pre-encoded glyph for every cell mask.
+    """
+    buffer = bytearray()
+
+    if len(rows) == 0:
+        return buffer
+
+    # (Cells, Cell_height, Cell_width, 3_colors) -> (Cells, Pixels_per_cell, 3_colors)
+    changed_colors = blocks[rows, :, cols]
+    fg_colors, bg_colors, masks = _cluster_cells(changed_colors.reshape(len(rows), -1, 3))
+
+    # Force int32 to avoid float conversions and ensure fast Python int access
+    update_data = np.column_stack((
+        cols, rows, 
+        fg_colors, bg_colors,
+        masks # 0 for solid cells
+    )).astype(np.int32)
+
+    # Optimization: REMOVED np.lexsort
+    # np.where already returns indices sorted by Row (y), then Column (x).
+    # Sorting again was redundant and expensive.
+    
+    # Convert to list for faster iteration in Python
+    updates_list = update_data.tolist()
+
+    # Initialize prev_y to -1 to detect the start of the frame
+    prev_y = -1
+    prev_x = -1
+    
+    # Optimization: Track previous color to avoid redundant ANSI codes
+    prev_r, prev_g, prev_b = -1, -1, -1
+    prev_r2, prev_g2, prev_b2 = -1, -1, -1
+    
+    # Local variable caching for speed
+    _extend = buffer.extend
+    _glyph_table = glyph_table
+    _space_char = b' '
+    _newline_seq = b'\r\n'
+    
+    # Split format strings to allow independent updates
+    _fg_fmt = b'\x1b[38;2;%d;%d;%dm'
+    _bg_fmt = b'\x1b[48;2;%d;%d;%dm'
+
+    for row in updates_list:
+        x, y = row[0], row[1]
+        
+        # Optimization: Efficient Moves
+        # Added y > 0 check to prevent newline at (0,0) when starting from -1.
+        # This forces an absolute move for the first line, ensuring correct alignment.
+        if use_newline and y == prev_y + 1 and x == 0 and y > 0:
+            # If we are starting a new line at x=0, just send a newline (2 bytes)
+            _extend(_newline_seq)
+        elif y != prev_y or x != prev_x + 1:
+            # Otherwise, use absolute positioning
+            _extend(move_sequences[y][x])
+        
+        r, g, b = row[2], row[3], row[4]
+        r2, g2, b2 = row[5], row[6], row[7]
+        mask = row[8] # Retrieved from vectorized clustering
+
+        # Optimization: Solid Block Detection
+        if not mask:
+            if (r2 != prev_r2 or g2 != prev_g2 or b2 != prev_b2):
+                _extend(_bg_fmt % (r2, g2, b2))
+                prev_r2, prev_g2, prev_b2 = r2, g2, b2
+            _extend(_space_char)
+        else:
+            # Two colored glyph
+            if (r != prev_r or g != prev_g or b != prev_b):
+                _extend(_fg_fmt % (r, g, b))
+                prev_r, prev_g, prev_b = r, g, b
+            
+            if (r2 != prev_r2 or g2 != prev_g2 or b2 != prev_b2):
+                _extend(_bg_fmt % (r2, g2, b2))
+                prev_r2, prev_g2, prev_b2 = r2, g2, b2
+            
+            _extend(_glyph_table[mask])
+        
+        prev_x = x
+        prev_y = y
+
+    return buffer
+
+def _encode_full_frame(blocks: np.ndarray, move_sequences: list, use_newline: bool,
+                       glyph_table: list[bytes]) -> bytearray:
+    """
+    Encodes every cell of a block grid, row by row.
+    Rows are written contiguously, so the only cursor positioning is at the start of each row.
+
+    Args:
+        blocks: The block grid (Rows, Cell_height, Columns, Cell_width, 3_colors) in uint8 BGR.
+        move_sequences: Pre-computed cursor moves, indexed [y][x].
+        use_newline: Whether '\\r\\n' may be used to move to the start of the next row.
+        glyph_table: The pre-encoded glyph for every cell mask.
+    """
+    rows_count, _, columns = blocks.shape[:3]
+
+    # (Rows, Columns, Cell_height, Cell_width, 3_colors) -> (Cells, Pixels_per_cell, 3_colors)
+    pixels = blocks.transpose(0, 2, 1, 3, 4).reshape(rows_count * columns, -1, 3)
+    fg_colors, bg_colors, masks = _cluster_cells(pixels)
+
+    # Force int32 to avoid float conversions and ensure fast Python int access
+    updates_list = np.column_stack((fg_colors, bg_colors, masks)).astype(np.int32).tolist()
+
+    buffer = bytearray()
+
+    # Optimization: Track previous color to avoid redundant ANSI codes
+    prev_r, prev_g, prev_b = -1, -1, -1
+    prev_r2, prev_g2, prev_b2 = -1, -1, -1
+
+    # Local variable caching for speed
+    _extend = buffer.extend
+    _glyph_table = glyph_table
+    _space_char = b' '
+    _newline_seq = b'\r\n'
+    _fg_fmt = b'\x1b[38;2;%d;%d;%dm'
+    _bg_fmt = b'\x1b[48;2;%d;%d;%dm'
+
+    for y in range(rows_count):
+        if use_newline and y > 0:
+            _extend(_newline_seq)
+        else:
+            _extend(move_sequences[y][0])
+
+        for r, g, b, r2, g2, b2, mask in updates_list[y * columns:(y + 1) * columns]:
+            if not mask:
+                if (r2 != prev_r2 or g2 != prev_g2 or b2 != prev_b2):
+                    _extend(_bg_fmt % (r2, g2, b2))
+                    prev_r2, prev_g2, prev_b2 = r2, g2, b2
+                _extend(_space_char)
+            else:
+                if (r != prev_r or g != prev_g or b != prev_b):
+                    _extend(_fg_fmt % (r, g, b))
+                    prev_r, prev_g, prev_b = r, g, b
+
+                if (r2 != prev_r2 or g2 != prev_g2 or b2 != prev_b2):
+                    _extend(_bg_fmt % (r2, g2, b2))
+                    prev_r2, prev_g2, prev_b2 = r2, g2, b2
+
+                _extend(_glyph_table[mask])
+
+    return buffer
+
+class TerminalRenderer:
+    """
+    Holds the geometry tables and the last displayed state of one video,
+    and turns frames into diff byte sequences.
+
+    Frames must be (rows * cell_height, columns * cell_width, 3) uint8 arrays, see frame_size.
+    Contiguous frames are read in place without copying.
+
+    Args:
+        columns: Width of the video in terminal cells.
+        rows: Height of the video in terminal cells.
+        compression: The threshold for color change detection.
+        glyph_mode: How source pixels are packed into cells (see glyphs.GLYPH_MODES).
+        origin: The (x, y) cell all cursor positions are offset by.
+        adaptive_rows: Whether rows are rewritten in full when that is cheaper than sparse updates.
+        scroll: Whether vertical pans and scrolls are sent as terminal scroll commands. Scroll
+            regions span the whole terminal width, so only enable this if nothing is drawn beside the video.
+        perceptual: Whether every cell gets its own threshold from the local luminance and texture,
+            and has to change consistently before it is resent.
+        rgb: Whether frames are in RGB order instead of OpenCV's BGR order.
+    """
+
+    def __init__(self, columns: int, rows: int, compression: int = 150,
+                 glyph_mode: str = 'half', origin: tuple[int, int] = (0, 0),
+                 adaptive_rows: bool = True, scroll: bool = False, perceptual: bool = False,
+                 rgb: bool = False):
+        if glyph_mode not in CELL_SHAPES:
+            raise ValueError(f"Unknown glyph mode '{glyph_mode}', expected one of {', '.join(CELL_SHAPES)}.")
+
+        self.columns = columns
+        self.rows = rows
+        self.adaptive_rows = adaptive_rows
+        self.scroll = scroll
+        self.perceptual = perceptual
+        self.cell_height, self.cell_width = CELL_SHAPES[glyph_mode]
+        self.glyph_table = GLYPH_TABLES[glyph_mode]
+
+        # The diff score sums over every pixel of a cell. Scale the threshold so a given
+        # compression value is equally sensitive per pixel in every glyph mode.
+        self.compression = compression * self.cell_height * self.cell_width // 2
+
+        # Pixel size of the frames this encoder expects, as (width, height) for cv2.resize
+        self.frame_size = (columns * self.cell_width, rows * self.cell_height)
+
+        # Pre-compute move sequences for this resolution
+        # This avoids lru_cache hashing overhead and function calls inside the loop
+        # move_sequences[y][x]
+        origin_x, origin_y = origin
+        self.move_sequences = [
+            [get_move_sequence_bytes((x + origin_x, y + origin_y)) for x in range(columns)]
+            for y in range(rows + 1) # +1 buffer just in case
+        ]
+
+        # '\r\n' returns to column 0 of the terminal, which is only the start of our row if we are not offset
+        self.use_newline = origin_x == 0
+
+        # Scroll region covering the video's rows (1-indexed, inclusive)
+        self.scroll_region = (origin_y + 1, origin_y + rows)
+
+        # The state the terminal shows after the last encoded frame
+        self.prev_blocks = None
+
+        # Per-resolution workspaces, so the diff doesn't allocate anything per frame
+        frame_width, frame_height = self.frame_size
+        blocks_shape = (rows, self.cell_height, columns, self.cell_width, 3)
+        self._prev_buffer = np.zeros(blocks_shape, dtype=np.uint8)
+        self._diff_buffer = np.empty(blocks_shape, dtype=np.uint8)
+        # Pixel rows of every cell with their channels flattened, so weighting is a single matmul.
+        # float32 is exact for these integer sums and lets the matmul use BLAS.
+        # The pixel row comes first, so every pixel row's scores are contiguous for the additions.
+        self._diff_float = np.empty((self.cell_height, rows, columns, self.cell_width * 3), dtype=np.float32)
+        self._weights_row = np.tile(PERCEPTUAL_WEIGHTS.astype(np.float32), self.cell_width)
+        self._row_scores = np.empty((self.cell_height, rows, columns), dtype=np.float32)
+        self._score_buffer = np.empty((rows, columns), dtype=np.float32)
+        self._mask_buffer = np.empty((rows, columns), dtype=bool)
+        self._pixel_mask = np.empty((frame_height, frame_width), dtype=np.uint8)
+        # Image shaped views of the same memory for cv2
+        self._prev_image = self._prev_buffer.reshape(frame_height, frame_width, 3)
+        self._diff_image = self._diff_buffer.reshape(frame_height, frame_width, 3)
+        # Mean luminance of every cell, used to estimate scrolling
+        self._gray = np.empty((frame_height, frame_width), dtype=np.uint8)
+        self._profile = np.empty((rows, columns), dtype=np.uint8)
+        self._prev_profile = np.empty((rows, columns), dtype=np.uint8)
+        # Perceptual model: per-cell threshold map and the number of frames every cell stayed above it
+        self._luminance = np.empty((rows, columns), dtype=np.float32)
+        self._local_mean = np.empty((rows, columns), dtype=np.float32)
+        self._local_variance = np.empty((rows, columns), dtype=np.float32)
+        self._threshold_map = np.empty((rows, columns), dtype=np.float32)
+        self._masking = np.empty((rows, columns), dtype=np.float32)
+        self._strong_mask = np.empty((rows, columns), dtype=bool)
+        self._pending_frames = np.zeros((rows, columns), dtype=np.uint8)
+
+        # Only every interlace-th row is updated per frame, in turns (1 updates every row)
+        self._interlace = 1
+        self._row_numbers = np.arange(rows)
+
+        # RGB frames are converted into this buffer
+        self.rgb = rgb
+        self._bgr_frame = np.empty((frame_height, frame_width, 3), dtype=np.uint8) if rgb else None
+
+        self.stats = dict.fromkeys(STAT_FIELDS, 0)
+        self.stats['interlace'] = 1
+
+    @property
+    def interlace(self) -> int:
+        """Only every interlace-th row is updated per frame, in turns. 1 (the default) updates every row."""
+        return self._interlace
+
+    @interlace.setter
+    def interlace(self, level: int):
+        self._interlace = max(int(level), 1)
+        self.stats['interlace'] = self._interlace
+
+    def reset(self):
+        """Forgets the displayed state, so the next frame is redrawn in full (e.g. after a seek)."""
+        self.prev_blocks = None
+
+    @property
+    def displayed_image(self) -> np.ndarray | None:
+        """
+        The displayed state as a BGR image, or None before the first frame.
+        A view of the encoder's state, which changes with every frame.
+        """
+        return self._prev_image if self.prev_blocks is not None else None
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Checks the shape of frame and returns it as a contiguous BGR image."""
+        width, height = self.frame_size
+        if frame.shape != (height, width, 3) or frame.dtype != np.uint8:
+            raise ValueError(f"Expected a ({height}, {width}, 3) uint8 frame, got {frame.shape} {frame.dtype}.")
+
+        if self.rgb:
+            cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=self._bgr_frame)
+            return self._bgr_frame
+        # Nothing is copied unless the frame isn't contiguous
+        return np.ascontiguousarray(frame)
+
+    def render(self, frame: np.ndarray) -> bytearray:
+        """Returns the escape sequences that update the displayed state to frame, and makes frame the displayed state."""
+        frame = self._prepare(frame)
+        # Reshape into blocks: (Rows, Cell_height, Columns, Cell_width, 3_colors), a view of the frame
+        blocks = frame.reshape(self.rows, self.cell_height, self.columns, self.cell_width, 3)
+        self.stats['frames_encoded'] += 1
+
+        if self.prev_blocks is None:
+            # Force full redraw for the first frame
+            return self._encode_full(blocks)
+
+        change_mask = self._diff(frame)
+
+        scroll_sequence = None
+        scrolled_rows = None
+        if self.scroll and np.count_nonzero(change_mask) > SCROLL_CHECK_THRESHOLD * change_mask.size:
+            shift = self._detect_scroll(frame)
+            if shift:
+                # Let the terminal move the content, then only diff the residual
+                scroll_sequence = self._scroll_prev(shift)
+                change_mask = self._diff(frame)
+                # The rows scrolled into view are blank on the terminal
+                if shift > 0:
+                    scrolled_rows = slice(-shift, None)
+                    self._pending_frames[:-shift] = self._pending_frames[shift:]
+                else:
+                    scrolled_rows = slice(None, -shift)
+                    self._pending_frames[-shift:] = self._pending_frames[:shift]
+                change_mask[scrolled_rows] = True
+                self._pending_frames[scrolled_rows] = HYSTERESIS_FRAMES
+
+        if self.perceptual:
+            self._apply_hysteresis(change_mask)
+
+        if self.interlace > 1:
+            # Under load, only update every interlace-th row on each frame. The other rows keep
+            # their displayed state, so they are diffed and sent when their turn comes.
+            phase = self.stats['frames_encoded'] % self.interlace
+            change_mask[(self._row_numbers - phase) % self.interlace != 0] = False
+            if scrolled_rows is not None:
+                # Rows scrolled into view must be drawn right away, the displayed state can't track them blank
+                change_mask[scrolled_rows] = True
+            self.stats['interlaced_frames'] += 1
+
+        if self.perceptual:
+            # Cells that are sent start counting again. Cells held back by interlacing keep
+            # their count, so they are sent when their row's turn comes.
+            self._pending_frames[change_mask] = 0
+
+        if np.count_nonzero(change_mask) > SCENE_CUT_THRESHOLD * change_mask.size:
+            # Scene cut: nearly every cell changed, so skip the sparse gather and cursor
+            # bookkeeping and rewrite the whole frame row by row
+            self.stats['cut_frames'] += 1
+            return self._encode_full(blocks)
+
+        if self.adaptive_rows:
+            self._promote_dense_rows(blocks, change_mask)
+
+        rows, cols = np.where(change_mask)
+        buffer = _encode_cells(blocks, rows, cols, self.move_sequences, self.use_newline, self.glyph_table)
+
+        if scroll_sequence:
+            buffer[:0] = scroll_sequence
+            self.stats['scroll_frames'] += 1
+
+        # The caller is expected to show every returned update, so the sent cells are displayed from now on
+        self._commit(frame, change_mask)
+
+        return buffer
+
+    def update(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Makes frame the displayed state without encoding it, e.g. to measure the diff stage on its own.
+        Skips scrolling, hysteresis and interlacing.
+
+        Returns:
+            The mask of cells that changed, as a (rows, columns) bool array that is reused by the next call.
+        """
+        frame = self._prepare(frame)
+        if self.prev_blocks is None:
+            np.copyto(self._prev_image, frame)
+            self._pending_frames.fill(0)
+            self.prev_blocks = self._prev_buffer
+            self._mask_buffer.fill(True)
+            return self._mask_buffer
+        change_mask = self._diff(frame)
+        self._commit(frame, change_mask)
+        return change_mask
+
+    def _diff(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Returns the mask of cells whose weighted difference to the displayed state exceeds the threshold.
+        Works entirely in the preallocated workspaces; the returned mask is one of them.
+        """
+        # Weighted Euclidean-ish Distance (Manhattan on weighted channels)
+        # Saturating uint8 absolute difference, no int16 copies of the frames needed
+        cv2.absdiff(frame, self._prev_image, dst=self._diff_image)
+        np.copyto(self._diff_float.transpose(1, 0, 2, 3),
+                  self._diff_buffer.reshape(self.rows, self.cell_height, self.columns, -1))
+        np.matmul(self._diff_float, self._weights_row, out=self._row_scores)
+        # Add up the pixel rows of every cell (np.sum would allocate a reduction buffer here)
+        np.add(self._row_scores[0], self._row_scores[1], out=self._score_buffer)
+        for pixel_row in range(2, self.cell_height):
+            np.add(self._score_buffer, self._row_scores[pixel_row], out=self._score_buffer)
+        threshold = self._update_threshold_map(frame) if self.perceptual else self.compression
+        return np.greater(self._score_buffer, threshold, out=self._mask_buffer)
+
+    def _update_threshold_map(self, frame: np.ndarray) -> np.ndarray:
+        """Computes the per-cell thresholds for frame from its local luminance and texture."""
+        # Mean luminance of every cell
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.resize(self._gray, (self.columns, self.rows), dst=self._profile, interpolation=cv2.INTER_AREA)
+        np.copyto(self._luminance, self._profile)
+
+        # Local variance over the 3x3 neighbouring cells: E[x^2] - E[x]^2
+        cv2.blur(self._luminance, (3, 3), dst=self._local_mean)
+        np.multiply(self._luminance, self._luminance, out=self._masking)
+        cv2.blur(self._masking, (3, 3), dst=self._local_variance)
+        np.multiply(self._local_mean, self._local_mean, out=self._masking)
+        np.subtract(self._local_variance, self._masking, out=self._local_variance)
+        np.maximum(self._local_variance, 0, out=self._local_variance)
+
+        # Contrast masking: 1 + std / MASKING_STD
+        np.sqrt(self._local_variance, out=self._masking)
+        np.multiply(self._masking, 1 / MASKING_STD, out=self._masking)
+        np.add(self._masking, 1, out=self._masking)
+
+        # Luminance masking: 0.5 + L / 255, plus up to DARK_MASKING near black
+        np.multiply(self._luminance, 1 / 255, out=self._threshold_map)
+        np.add(self._threshold_map, 0.5, out=self._threshold_map)
+        np.subtract(DARK_LEVEL, self._luminance, out=self._luminance)
+        np.clip(self._luminance, 0, DARK_LEVEL, out=self._luminance)
+        np.multiply(self._luminance, DARK_MASKING / DARK_LEVEL, out=self._luminance)
+        np.add(self._threshold_map, self._luminance, out=self._threshold_map)
+
+        np.multiply(self._threshold_map, self._masking, out=self._threshold_map)
+        np.multiply(self._threshold_map, self.compression, out=self._threshold_map)
+        return self._threshold_map
+
+    def _apply_hysteresis(self, change_mask: np.ndarray):
+        """
+        Only keeps the cells of change_mask that exceeded their threshold for HYSTERESIS_FRAMES
+        frames in a row, or by STRONG_CHANGE_FACTOR. Modifies change_mask in place.
+        """
+        # Count how many frames in a row every cell was above its threshold
+        np.add(self._pending_frames, 1, out=self._pending_frames, where=change_mask)
+        np.multiply(self._pending_frames, change_mask, out=self._pending_frames)
+
+        np.multiply(self._threshold_map, STRONG_CHANGE_FACTOR, out=self._masking)
+        np.greater(self._score_buffer, self._masking, out=self._strong_mask)
+        np.greater_equal(self._pending_frames, HYSTERESIS_FRAMES, out=change_mask)
+        np.logical_or(change_mask, self._strong_mask, out=change_mask)
+
+    def _detect_scroll(self, frame: np.ndarray) -> int:
+        """
+        Estimates the dominant vertical shift between the displayed state and frame, in cell rows.
+
+        Returns:
+            The number of rows the content moved up (positive) or down (negative),
+            or 0 if shifting doesn't explain the frame well.
+        """
+        # Compare the mean luminance of every cell, shifted by every candidate amount
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.resize(self._gray, (self.columns, self.rows), dst=self._profile, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._prev_image, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.resize(self._gray, (self.columns, self.rows), dst=self._prev_profile, interpolation=cv2.INTER_AREA)
+        current = self._profile.astype(np.int16)
+        previous = self._prev_profile.astype(np.int16)
+
+        unshifted_error = np.mean(np.abs(current - previous))
+        best_shift, best_error = 0, unshifted_error
+
+        # At least half of the rows have to overlap
+        for shift in range(1, self.rows // 2 + 1):
+            up_error = np.mean(np.abs(current[:-shift] - previous[shift:]))
+            if up_error < best_error:
+                best_shift, best_error = shift, up_error
+            down_error = np.mean(np.abs(current[shift:] - previous[:-shift]))
+            if down_error < best_error:
+                best_shift, best_error = -shift, down_error
+
+        if best_error > SCROLL_MAX_ERROR or best_error > unshifted_error / 2:
+            return 0
+        return best_shift
+
+    def _scroll_prev(self, shift: int) -> bytes:
+        """
+        Shifts the displayed state by shift rows (positive moves the content up)
+        and returns the terminal sequence that does the same on screen.
+        """
+        top, bottom = self.scroll_region
+        if shift > 0:
+            self._prev_buffer[:-shift] = self._prev_buffer[shift:]
+            command = b'\x1b[%dS' % shift # SU: scroll up
+        else:
+            self._prev_buffer[-shift:] = self._prev_buffer[:shift]
+            command = b'\x1b[%dT' % -shift # SD: scroll down
+        # DECSTBM limits the scroll to the video's rows, then the full screen region is restored
+        return b'\x1b[%d;%dr' % (top, bottom) + command + b'\x1b[r'
+
+    def _commit(self, frame: np.ndarray, change_mask: np.ndarray):
+        """Copies the changed cells of frame into the displayed state, in place."""
+        # Expand the cell mask to pixels; the exact variant maps every pixel to its own cell
+        cv2.resize(change_mask.view(np.uint8), self.frame_size, dst=self._pixel_mask,
+                   interpolation=cv2.INTER_NEAREST_EXACT)
+        cv2.copyTo(frame, self._pixel_mask, self._prev_image)
+
+    def _encode_full(self, blocks: np.ndarray) -> bytearray:
+        """Redraws the whole frame and makes it the displayed state."""
+        np.copyto(self._prev_buffer, blocks)
+        self._pending_frames.fill(0)
+        self.prev_blocks = self._prev_buffer
+        return _encode_full_frame(blocks, self.move_sequences, self.use_newline, self.glyph_table)
+
+    def _promote_dense_rows(self, blocks: np.ndarray, change_mask: np.ndarray):
+        """
+        Marks every cell of a row as changed where rewriting the whole row is estimated
+        to take fewer bytes than the sparse updates. Modifies change_mask in place.
+        """
+        # A cell with the same colors as its left neighbour only costs its glyph when the
+        # neighbour was drawn right before it, because the color sequences are skipped.
+        same_as_left = np.zeros_like(change_mask)
+        same_as_left[:, 1:] = np.all(blocks[:, :, 1:] == blocks[:, :, :-1], axis=(1, 3, 4))
+        cell_cost = np.where(same_as_left, GLYPH_BYTES, CELL_BYTES)
+
+        # Every run of changed cells starts with a cursor move and fresh colors
+        run_starts = change_mask.copy()
+        run_starts[:, 1:] &= ~change_mask[:, :-1]
+        run_count = np.count_nonzero(run_starts, axis=1)
+
+        sparse_cost = np.sum(cell_cost, axis=1, where=change_mask & ~run_starts) + run_count * (MOVE_BYTES + CELL_BYTES)
+        full_cost = np.sum(cell_cost, axis=1) + MOVE_BYTES
+
+        promoted = (full_cost < sparse_cost) & (run_count > 0)
+        if promoted.any():
+            change_mask[promoted] = True
+            self.stats['rows_rewritten'] += int(np.count_nonzero(promoted))
+            self.stats['row_bytes_saved'] += int(np.sum(sparse_cost[promoted] - full_cost[promoted]))
+
+    def write(self, frame: np.ndarray, fd: int = 1) -> int:
+        """
+        Renders frame and writes the update to a file descriptor (stdout by default).
+
+        Returns:
+            The number of bytes written.
+        """
+        data = self.render(frame)
+        write_all(fd, data)
+        return len(data)
+
+    def render_keyframe(self) -> bytearray:
+        """Returns a full redraw of the displayed state, which is empty until the first frame is rendered."""
+        if self.prev_blocks is None:
+            return bytearray()
+        return _encode_full_frame(self.prev_blocks, self.move_sequences, self.use_newline, self.glyph_table)
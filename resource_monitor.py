@@ -0,0 +1,152 @@
+"""
+Sampling monitor of the resources used by the player and its producer processes.
+
+A background thread samples CPU usage, resident memory and the context switch rate of every
+registered process, and the occupancy of the shared memory pools, at a fixed interval.
+Sampling only reads counters the OS keeps anyway, so its cost per process and interval is in
+the order of 100 microseconds, depending on the OS. To measure it, time ResourceMonitor._sample()
+with timeit. The latest sample is published to the debug terminal and a summary is printed on exit
+for capacity planning.
+"""
+
+import threading
+import time
+
+import psutil
+
+DEFAULT_SAMPLE_INTERVAL = 1.0 # Seconds
+
+class _ProcessTotals:
+    """Running totals of one process over all samples, for the summary."""
+
+    def __init__(self):
+        self.samples = 0
+        self.cpu_sum = 0.0
+        self.cpu_max = 0.0
+        self.rss_max = 0
+        self.switch_rate_sum = 0.0
+        self.switch_rate_max = 0.0
+
+class ResourceMonitor:
+    """
+    Samples processes and shared memory pools in a background thread.
+
+    Args:
+        interval: Seconds between two samples.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        # name -> (psutil.Process, context switches at the last sample, time of the last sample)
+        self.processes = {}
+        # name -> (function returning the bytes in use, capacity in bytes)
+        self.pools = {}
+        self.process_totals = {}
+        # name -> (sum of the bytes in use, maximum bytes in use, samples)
+        self.pool_totals = {}
+        self.stats = {}
+        self.started_at = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def add_process(self, name: str, pid: int):
+        """Starts sampling a process. Processes that exit are dropped from sampling."""
+        try:
+            process = psutil.Process(pid)
+            # The first call only starts the measurement, later calls return the usage since the last one
+            process.cpu_percent(None)
+            switches = sum(process.num_ctx_switches())
+        except psutil.Error:
+            return
+        with self.lock:
+            self.processes[name] = (process, switches, time.perf_counter())
+            self.process_totals.setdefault(name, _ProcessTotals())
+
+    def add_pool(self, name: str, get_bytes_in_use, capacity: int):
+        """Starts sampling the occupancy of a shared memory pool of capacity bytes."""
+        with self.lock:
+            self.pools[name] = (get_bytes_in_use, capacity)
+            self.pool_totals.setdefault(name, [0, 0, 0])
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=self.interval + 1.0)
+
+    def get_stats(self) -> dict:
+        """Returns the latest sample as a flat name -> value dict."""
+        return dict(self.stats)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        stats = {}
+        with self.lock:
+            for name, (process, last_switches, last_time) in list(self.processes.items()):
+                try:
+                    with process.oneshot():
+                        if process.status() == psutil.STATUS_ZOMBIE:
+                            # Exited, but not reaped by its parent yet
+                            raise psutil.ZombieProcess(process.pid)
+                        cpu = process.cpu_percent(None)
+                        rss = process.memory_info().rss
+                        switches = sum(process.num_ctx_switches())
+                except psutil.Error:
+                    del self.processes[name]
+                    continue
+                now = time.perf_counter()
+                switch_rate = (switches - last_switches) / max(now - last_time, 1e-6)
+                self.processes[name] = (process, switches, now)
+
+                totals = self.process_totals[name]
+                totals.samples += 1
+                totals.cpu_sum += cpu
+                totals.cpu_max = max(totals.cpu_max, cpu)
+                totals.rss_max = max(totals.rss_max, rss)
+                totals.switch_rate_sum += switch_rate
+                totals.switch_rate_max = max(totals.switch_rate_max, switch_rate)
+
+                stats[f'{name}_cpu_%'] = round(cpu, 1)
+                stats[f'{name}_rss_mb'] = round(rss / (1024 * 1024), 1)
+                stats[f'{name}_switches_per_s'] = round(switch_rate)
+
+            for name, (get_bytes_in_use, capacity) in self.pools.items():
+                bytes_in_use = max(get_bytes_in_use(), 0)
+                totals = self.pool_totals[name]
+                totals[0] += bytes_in_use
+                totals[1] = max(totals[1], bytes_in_use)
+                totals[2] += 1
+
+                stats[f'{name}_in_use_kb'] = round(bytes_in_use / 1024, 1)
+                stats[f'{name}_in_use_%'] = round(bytes_in_use / capacity * 100, 3) if capacity else 0.0
+
+        self.stats = stats
+
+    def summary(self) -> str:
+        """Returns the averages and peaks over all samples, one line per process and pool."""
+        lines = []
+        if self.started_at is not None:
+            lines.append(f"Resource usage over {time.perf_counter() - self.started_at:.1f} s, "
+                         f"sampled every {self.interval:g} s:")
+        with self.lock:
+            for name, totals in self.process_totals.items():
+                if not totals.samples:
+                    continue
+                lines.append(f"  {name}: CPU mean {totals.cpu_sum / totals.samples:.1f}%, max {totals.cpu_max:.1f}%; "
+                             f"RSS max {totals.rss_max / (1024 * 1024):.1f} MB; "
+                             f"context switches mean {totals.switch_rate_sum / totals.samples:.0f}/s, "
+                             f"max {totals.switch_rate_max:.0f}/s")
+            for name, (bytes_sum, bytes_max, samples) in self.pool_totals.items():
+                if not samples:
+                    continue
+                capacity = self.pools[name][1]
+                lines.append(f"  {name}: mean {bytes_sum / samples / 1024:.1f} KB, max {bytes_max / 1024:.1f} KB "
+                             f"in use of {capacity / (1024 * 1024):.0f} MB")
+        return '\n'.join(lines)
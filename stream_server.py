@@ -0,0 +1,253 @@
+"""
+Fan-out streaming of the encoded diff byte stream.
+One producer pipeline encodes the video once and any number of thin clients
+write the received bytes straight to their terminal.
+"""
+
+import logging
+import os
+import queue
+import socket
+import stat
+import threading
+import time
+
+import terminal_api
+import video_decoder
+
+# Full redraw interval in seconds. Late joiners and slow clients wait at most this long to resync.
+DEFAULT_KEYFRAME_SECONDS = 1.0
+
+# Frames a client may lag behind before its backlog is dropped and it is resynced with a keyframe
+DEFAULT_MAX_BACKLOG = 64
+
+def parse_address(address: str) -> tuple[int, str | tuple[str, int]]:
+    """
+    Parses a listen/connect address.
+
+    Accepted forms are 'unix:/path/to/socket', 'host:port' and 'port' (localhost).
+
+    Returns:
+        A tuple (socket family, socket address).
+    """
+    if address.startswith('unix:'):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("Unix sockets are not supported on this platform.")
+        return socket.AF_UNIX, address[len('unix:'):]
+
+    host, _, port = address.rpartition(':')
+    try:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    except ValueError:
+        raise ValueError(f"Invalid address '{address}', expected 'host:port', 'port' or 'unix:/path'.")
+
+class _Client:
+    """A connected client with its own bounded send queue and sender thread."""
+
+    def __init__(self, sock: socket.socket, max_backlog: int):
+        self.sock = sock
+        self.queue = queue.Queue(maxsize=max_backlog)
+        # Every client starts with a full redraw before it receives any diffs
+        self.needs_keyframe = True
+        self.resyncs = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+
+    def _send_loop(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                self.sock.sendall(data)
+        except OSError:
+            pass
+        finally:
+            self.closed = True
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _drop_backlog(self):
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def send_diff(self, data: bytes):
+        if self.needs_keyframe:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            # The client can't keep up. Drop its backlog instead of letting it grow,
+            # and wait for the next keyframe to bring it back in sync.
+            self._drop_backlog()
+            self.needs_keyframe = True
+            self.resyncs += 1
+
+    def send_keyframe(self, data: bytes):
+        if not self.needs_keyframe:
+            return
+        self._drop_backlog()
+        self.queue.put(data)
+        self.needs_keyframe = False
+
+    def close(self):
+        """Lets the sender flush its queue, then closes the connection."""
+        try:
+            self.queue.put(None, timeout=1.0)
+        except queue.Full:
+            self._drop_backlog()
+            self.queue.put(None)
+
+def _remove_stale_socket(path: str):
+    """
+    Removes a unix socket file left behind by a server that is gone.
+    Raises FileExistsError if path isn't a socket or a server is still listening on it.
+    """
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise FileExistsError(f"'{path}' exists and is not a socket.")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            # Nobody listens anymore
+            os.unlink(path)
+            return
+    raise FileExistsError(f"'{path}' is in use by another server.")
+
+class StreamServer:
+    """
+    Runs one producer pipeline and serves its encoded diff stream to any number of clients.
+
+    Args:
+        decoder: The decoder to stream. Its keyframe_interval is set if it has none.
+        address: The address to listen on (see parse_address). Port 0 picks a free port.
+        max_backlog: Frames a client may lag behind before it is resynced.
+    """
+
+    def __init__(self, decoder: video_decoder.VideoDecoder, address: str = '127.0.0.1:0',
+                 max_backlog: int = DEFAULT_MAX_BACKLOG):
+        self.decoder = decoder
+        self.max_backlog = max_backlog
+        self.clients: list[_Client] = []
+        self.clients_lock = threading.Lock()
+        self.running = False
+        self.logger = logging.getLogger(__name__)
+
+        if not self.decoder.keyframe_interval:
+            frame_rate = self.decoder.get_frame_rate() or 30
+            self.decoder.keyframe_interval = max(1, int(frame_rate * DEFAULT_KEYFRAME_SECONDS))
+
+        family, sock_address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        elif os.path.exists(sock_address):
+            _remove_stale_socket(sock_address)
+        self.sock.bind(sock_address)
+        self.sock.listen()
+
+        self.accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+
+    @property
+    def address(self) -> str:
+        """The address clients can connect to."""
+        sock_address = self.sock.getsockname()
+        if self.sock.family == socket.AF_INET:
+            return f"{sock_address[0]}:{sock_address[1]}"
+        return f"unix:{sock_address}"
+
+    def get_client_count(self) -> int:
+        with self.clients_lock:
+            return len(self.clients)
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client_sock, _ = self.sock.accept()
+            except OSError:
+                break
+            if client_sock.family == socket.AF_INET:
+                client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.clients_lock:
+                self.clients.append(_Client(client_sock, self.max_backlog))
+            self.logger.info("Client connected (%d total)", self.get_client_count())
+
+    def _broadcast(self, data: bytes, is_keyframe: bool):
+        with self.clients_lock:
+            self.clients = [client for client in self.clients if not client.closed]
+            for client in self.clients:
+                if is_keyframe:
+                    client.send_keyframe(data)
+                else:
+                    client.send_diff(data)
+
+    def serve(self):
+        """Streams the whole video at its frame rate, then disconnects all clients."""
+        self.running = True
+        self.accept_thread.start()
+
+        frame_time = 1.0 / (self.decoder.get_frame_rate() or 30)
+        generator = self.decoder.diff_frame_generator(with_keyframes=True)
+        frame_idx = 0
+        start_time = None
+
+        try:
+            for data, is_keyframe in generator:
+                if is_keyframe:
+                    self._broadcast(data, True)
+                    continue
+
+                if start_time is None:
+                    # Don't count the time it took to load the first frame as lag
+                    start_time = time.time()
+
+                # The first frame is a full redraw, so it doubles as the first keyframe
+                self._broadcast(data, frame_idx == 0)
+                frame_idx += 1
+
+                # Pace the stream to the video's frame rate
+                target_time = start_time + frame_idx * frame_time
+                sleep_time = target_time - time.time()
+                if sleep_time > 0.005:
+                    time.sleep(sleep_time)
+                elif sleep_time < -0.2:
+                    start_time = time.time() - frame_idx * frame_time
+        finally:
+            generator.close()
+            self.close()
+
+    def close(self):
+        self.running = False
+        unix_path = self.sock.getsockname() if self.sock.family != socket.AF_INET and self.sock.fileno() != -1 else None
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        if unix_path and os.path.exists(unix_path):
+            os.unlink(unix_path)
+        with self.clients_lock:
+            for client in self.clients:
+                client.close()
+            clients = self.clients
+            self.clients = []
+        for client in clients:
+            client.thread.join(timeout=1.0)
+
+def run_client(address: str, output_fd: int = 1):
+    """
+    Connects to a stream server and writes the received byte stream to output_fd until the stream ends.
+    """
+    family, sock_address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(sock_address)
+        while True:
+            data = sock.recv(1024 * 1024)
+            if not data:
+                break
+            terminal_api.write_all(output_fd, data)
@@ -1,9 +1,13 @@
 import sys
 import os
+import logging
+from contextlib import contextmanager
 from functools import lru_cache
 
 from blessed import Terminal
 
+import daemon_helper
+
 if os.name == 'nt':
     os.system('chcp 65001 >nul')
 
@@ -25,6 +29,43 @@ def reset_text_color(terminal: Terminal):
     """Resets the text color to default."""
     print(terminal.normal, end='', flush=True)
 
+@contextmanager
+def playback_session(terminal: Terminal, debug_mode: bool = False):
+    """
+    Prepares the terminal for playing inside the with block and restores it afterwards.
+    Ctrl+C ends the block quietly, other errors are re-raised after clearing the screen.
+
+    Args:
+        terminal (Terminal): The terminal object used to clear the screen.
+        debug_mode: Whether to start the debug terminal. Otherwise logging is limited to errors.
+    """
+    clear_screen(terminal)
+    hide_cursor()
+
+    if debug_mode:
+        daemon_helper.start_daemon()
+    else:
+        logging.getLogger().setLevel(logging.ERROR)
+
+    try:
+        yield
+
+    except KeyboardInterrupt:
+        pass
+
+    except Exception as e:
+        clear_screen(terminal)
+        reset_text_color(terminal)
+        show_cursor()
+        raise Exception(f"\nAn error occurred: {e}")
+    finally:
+        # Always restore terminal state, even if interrupted or exception occurred
+        reset_text_color(terminal)
+        show_cursor()
+
+    # Avoid clearing the error message
+    clear_screen(terminal)
+
 def print_at(pos: tuple[int, int], text: str):
     """
     Prints the given text at the specified (x, y) position in the terminal.
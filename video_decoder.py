@@ -1,239 +1,466 @@
 import cv2
 import numpy as np
 import multiprocessing
+import os
+import queue
 from multiprocessing import shared_memory
 import time
-from terminal_api import get_move_sequence_bytes
-from constants import PERCEPTUAL_WEIGHT_BLUE, PERCEPTUAL_WEIGHT_GREEN, PERCEPTUAL_WEIGHT_RED
+from glyphs import CELL_SHAPES, GLYPH_TABLES
+from renderer import TerminalRenderer, STAT_FIELDS
 
 # Pre-encode the block character to avoid doing it millions of times
-BLOCK_CHAR = '▀'.encode('utf-8')
+BLOCK_CHAR = GLYPH_TABLES['half'][1]
+
+# Allocate 4MB per frame buffer to handle most frames.
+# Large frames (scene changes) will span multiple chunks.
+# 4MB * 512 buffers ~= 2GB RAM.
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+DEFAULT_NUM_BUFFERS = 512
+
+# Counters the producer publishes to the consumer through shared memory
+PRODUCER_STAT_FIELDS = STAT_FIELDS
+
+# Load thresholds of the automatic degradation to interlaced row updates.
+# The terminal is overloaded while fewer frames are buffered or playback is slower than this.
+DEGRADE_BUFFERED_FRAMES = 2
+DEGRADE_SPEED = 0.9
+# Playback speed from which the terminal counts as having headroom again
+RECOVER_SPEED = 0.98
+# Frames a load condition has to persist before the interlace level changes, so it doesn't flap
+DEGRADE_HOLD_FRAMES = 30
+RECOVER_HOLD_FRAMES = 90
+# Shared memory buffers while degradation is enabled. Frames are encoded at the interlace level
+# of their time, so a level change shows after at most this many frames (half a second at 30 fps).
+DEGRADE_NUM_BUFFERS = 16
+
+# Put into the ready queue by the producer once it has handled a flush request of the consumer
+FLUSH_MARKER = 'flush'
+# Put into the ready queue by the producer at the end of the source, where it waits for flush requests
+END_MARKER = 'end'
+
+class DegradationController:
+    """
+    Chooses the interlace level of the producer from the load on the consumer side.
+    The level goes up one step after DEGRADE_HOLD_FRAMES overloaded frames, and back down
+    one step after RECOVER_HOLD_FRAMES frames with headroom.
+
+    Args:
+        max_interlace: The highest interlace level to degrade to.
+    """
+
+    def __init__(self, max_interlace: int = 2):
+        self.max_interlace = max_interlace
+        self.level = 1
+        self.level_changes = 0
+        # Smoothed playback speed, single frames are too noisy to act on
+        self.speed = 1.0
+        self.overloaded_frames = 0
+        self.healthy_frames = 0
+        # Set while the buffer refills after a flush, when few buffered frames don't mean overload
+        self.refilling = False
+
+    def notify_flush(self):
+        """Tells the controller that the buffered frames were dropped (e.g. after a speed change)."""
+        self.refilling = True
+
+    def update(self, frames_buffered: int, playback_speed: float) -> int:
+        """Feeds the load after a frame and returns the interlace level to use."""
+        self.speed += 0.1 * (min(playback_speed, 2.0) - self.speed)
+        if frames_buffered >= DEGRADE_BUFFERED_FRAMES:
+            self.refilling = False
+        buffer_low = frames_buffered < DEGRADE_BUFFERED_FRAMES and not self.refilling
+
+        if buffer_low or self.speed < DEGRADE_SPEED:
+            self.overloaded_frames += 1
+            self.healthy_frames = 0
+        elif self.speed >= RECOVER_SPEED:
+            self.healthy_frames += 1
+            self.overloaded_frames = 0
+
+        if self.overloaded_frames >= DEGRADE_HOLD_FRAMES and self.level < self.max_interlace:
+            self.level += 1
+            self.level_changes += 1
+            self.overloaded_frames = 0
+        elif self.healthy_frames >= RECOVER_HOLD_FRAMES and self.level > 1:
+            self.level -= 1
+            self.level_changes += 1
+            self.healthy_frames = 0
+
+        return self.level
+
+class FramePool:
+    """
+    The shared memory buffers a producer process writes encoded frames into (see _send_to_shm),
+    and the queues that pass their indices between the producer and the consumer.
+    The producer ends with _finish_producer(), the consumer with close().
+
+    Args:
+        buffer_size: The size of every buffer. Larger frames span several buffers.
+        num_buffers: The number of buffers, which limits how far the producer gets ahead.
+    """
+
+    def __init__(self, buffer_size: int, num_buffers: int):
+        self.buffer_size = buffer_size
+        self.num_buffers = num_buffers
+        self.shm = shared_memory.SharedMemory(create=True, size=buffer_size * num_buffers)
+        self.free_queue = multiprocessing.Queue()
+        self.ready_queue = multiprocessing.Queue()
+        for i in range(num_buffers):
+            self.free_queue.put(i)
+        self.process = None
+
+    def start(self, target, *args, **kwargs):
+        """
+        Starts target(*args, shm_name=..., buffer_size=..., free_queue=..., ready_queue=..., **kwargs)
+        as the producer process.
+        """
+        self.process = multiprocessing.Process(
+            target=target, args=args,
+            kwargs=dict(shm_name=self.shm.name, buffer_size=self.buffer_size,
+                        free_queue=self.free_queue, ready_queue=self.ready_queue, **kwargs),
+            daemon=False # Changed to False to ensure queue flushes before exit
+        )
+        self.process.start()
+
+    def get(self):
+        """Blocks until the producer sends the next item, None once it ended."""
+        return self.ready_queue.get()
+
+    def read(self, idx: int, size: int) -> bytes:
+        """Copies the data out of a buffer and returns the buffer to the producer."""
+        offset = idx * self.buffer_size
+        # bytes() creates a copy, which is safe as we are about to release the buffer
+        data = bytes(self.shm.buf[offset:offset+size])
+        self.release(idx)
+        return data
+
+    def release(self, idx: int):
+        """Returns a buffer to the producer without reading it."""
+        self.free_queue.put(idx)
+
+    def get_ready_count(self) -> int:
+        """Returns the number of items the producer sent that weren't taken yet."""
+        try:
+            return self.ready_queue.qsize()
+        except NotImplementedError:
+            # Not available on macOS
+            return 0
+
+    def close(self):
+        """Stops the producer if it is still running and frees the shared memory."""
+        if self.process is not None and self.process.is_alive():
+            # Send sentinel to unblock producer if it's waiting
+            self.free_queue.put(None)
+            self.process.join(timeout=1.0)
+            if self.process.is_alive():
+                self.process.terminate()
+
+        self.shm.close()
+        self.shm.unlink() # Mark for deletion
+
+def _finish_producer(shm: shared_memory.SharedMemory, ready_queue: multiprocessing.Queue, stopped: bool = False):
+    """
+    Signals the end of the frames to the consumer and detaches the producer from the pool.
+    stopped tells that the consumer sent the stop sentinel and doesn't read anymore.
+    """
+    ready_queue.put(None) # Signal EOF
+
+    # Allow time for the queue to flush to the pipe before process exit
+    # This prevents the "premature end" where buffered frames are lost when the process dies
+    if not stopped:
+        time.sleep(0.5)
+
+    shm.close()
+
+def _send_to_shm(shm: shared_memory.SharedMemory, buffer: bytearray, buffer_size: int,
+                 free_queue: multiprocessing.Queue, ready_queue: multiprocessing.Queue,
+                 is_keyframe: bool = False, source_index: int = 0, shm_usage=None) -> bool:
+    """
+    Copies a frame into free shared memory buffers and notifies the consumer.
+    source_index is the index of the frame in the source, which differs from the number of
+    frames sent when frames are skipped. The bytes written are added to shm_usage[0].
+
+    Returns:
+        False if the consumer sent the stop sentinel, True otherwise.
+    """
+    # Handle data larger than buffer size by chunking (though 64MB should be enough)
+    total_len = len(buffer)
+    sent_len = 0
+    
+    while sent_len < total_len or total_len == 0:
+        # Get a free buffer index (blocks if full)
+        idx = free_queue.get()
+        if idx is None: # Sentinel received
+            return False
+        
+        chunk_size = min(total_len - sent_len, buffer_size)
+        
+        if chunk_size > 0:
+            offset = idx * buffer_size
+            # Direct memory copy into shared buffer
+            shm.buf[offset:offset+chunk_size] = buffer[sent_len:sent_len+chunk_size]
+            if shm_usage is not None:
+                shm_usage[0] += chunk_size
+        
+        sent_len += chunk_size
+
+        # Notify consumer that data is ready
+        # We send the chunk size. If it's a partial frame, the consumer just prints it.
+        # Note: This might cause slight tearing if the consumer sleeps between chunks, 
+        # but with 64MB buffer, this loop usually runs only once.
+        # Keyframe chunks are flagged and marked when they complete the keyframe.
+        ready_queue.put((idx, chunk_size, is_keyframe, sent_len >= total_len, source_index))
+        
+        # If total_len was 0 (empty frame), we sent one empty update and break
+        if total_len == 0:
+            break
+
+    return True
+
+def _wait_for_flush(free_queue: multiprocessing.Queue, ready_queue: multiprocessing.Queue,
+                    shared_flushes, flushes: int) -> bool:
+    """
+    Waits at the end of the source until the consumer requests a flush or stops.
+    Buffers the consumer returns in the meantime are held back and freed again on a flush.
+
+    Returns:
+        True if a flush was requested, False if the consumer sent the stop sentinel.
+    """
+    ready_queue.put((END_MARKER,))
+    held = []
+    while shared_flushes.value == flushes:
+        try:
+            idx = free_queue.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        if idx is None:
+            return False
+        held.append(idx)
+
+    for idx in held:
+        free_queue.put(idx)
+    return True
 
 def _video_producer_process(file_path: str, resolution: int, 
                           shm_name: str, buffer_size: int, 
                           free_queue: multiprocessing.Queue, ready_queue: multiprocessing.Queue,
-                          compression: int):
+                          compression: int, origin: tuple[int, int] = (0, 0), cpu: int | None = None,
+                          keyframe_interval: int = 0, glyph_mode: str = 'half',
+                          shared_stats=None, scroll: bool = False, perceptual: bool = False,
+                          frame_cache=None, shared_interlace=None, shared_speed=None, shared_flushes=None,
+                          shared_resume=None, shm_usage=None):
     """
     Standalone function to run in a separate process.
     Decodes video and puts byte sequences into shared memory.
+    All cursor positions are offset by origin (x, y) so several producers can share one screen.
+    If keyframe_interval is set, a full redraw of the current state is sent after every
+    keyframe_interval frames, so late joiners can resync to the diff stream.
+    The encoder's counters are published to shared_stats, in the order of PRODUCER_STAT_FIELDS.
+    With a frame_cache, cached frames are read from the cache instead of being decoded and resized,
+    and frames that aren't cached yet are added to it.
+    The interlace level of the encoder follows shared_interlace, which the consumer sets under load.
+    Above 1x shared_speed, frames in between the shown ones are skipped with grab(), which demuxes
+    and decodes them but skips the conversion and resize. When shared_flushes changes, the consumer
+    dropped the frames buffered so far, so decoding resumes at the source index in shared_resume,
+    with a full redraw after a FLUSH_MARKER. For this, the producer waits at the end of the source
+    instead of exiting.
+    The bytes written to shared memory are counted in shm_usage[0].
     """
+    # Pin to a single core so several producers (mosaic tiles) don't migrate onto each other
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            pass
+
     # Attach to the existing shared memory block
     shm = shared_memory.SharedMemory(name=shm_name)
 
-    # The process must open its own file handle; handles cannot be pickled across processes
-    cap = cv2.VideoCapture(file_path)
-    if not cap.isOpened():
-        ready_queue.put(None)
-        shm.close()
-        return
+    cached = frame_cache.load(file_path, resolution, glyph_mode) if frame_cache is not None else None
+    cap = None
+    cache_writer = None
 
-    original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    original_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-    aspect_ratio = original_width / original_height
-    frame_height = resolution
-    frame_width = int(frame_height * aspect_ratio)
-
-    # Pre-compute move sequences for this resolution
-    # This avoids lru_cache hashing overhead and function calls inside the loop
-    # move_sequences[y][x]
-    # We use h // 2 because we are rendering blocks (2 pixels high)
-    rows_count = frame_height // 2
-    move_sequences = [
-        [get_move_sequence_bytes((x, y)) for x in range(frame_width)]
-        for y in range(rows_count + 1) # +1 buffer just in case
-    ]
-
-    # Perceptual weights for BGR: Blue, Green, Red
-    # This matches human eye perception (Luma) to prioritize Green/Brightness changes
-    # and ignore subtle Blue/Red noise.
-    perceptual_weights = np.array([PERCEPTUAL_WEIGHT_BLUE, PERCEPTUAL_WEIGHT_GREEN, PERCEPTUAL_WEIGHT_RED], dtype=np.int16)
-
-    prev_blocks = None
+    if cached is not None:
+        # Everything is already decoded and resized
+        cell_height, cell_width = CELL_SHAPES[glyph_mode]
+        frame_width = cached.frames.shape[2] // cell_width
+        rows_count = cached.frames.shape[1] // cell_height
+    else:
+        # The process must open its own file handle; handles cannot be pickled across processes
+        cap = cv2.VideoCapture(file_path)
+        if not cap.isOpened():
+            ready_queue.put(None)
+            shm.close()
+            return
 
-    try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        original_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-            # Resize frame to target resolution
-            # INTER_LINEAR is faster than INTER_AREA
-            frame = cv2.resize(frame, (frame_width, frame_height), interpolation=cv2.INTER_LINEAR)
+        aspect_ratio = original_width / original_height
+        # The video always covers resolution // 2 rows of cells, whatever the glyph mode.
+        # Denser glyph modes pack more source pixels into each of these cells.
+        frame_width = int(resolution * aspect_ratio)
+        rows_count = resolution // 2
 
-            # Reshape into blocks: (Rows//2, 2_vertical_pixels, Columns, 3_colors)
-            h, w, c = frame.shape
-            # Cast to int16 immediately to avoid repeated casting during diff and allow negative subtraction
-            blocks = frame.reshape(h // 2, 2, w, c).astype(np.int16)
+    encoder = TerminalRenderer(frame_width, rows_count, compression, glyph_mode, origin,
+                            scroll=scroll, perceptual=perceptual)
+    resized = np.empty((encoder.frame_size[1], encoder.frame_size[0], 3), dtype=np.uint8)
+    frame_number = 0
+    # Index of the current frame in the source
+    source_index = -1
+    # Source frames to advance by, and the fraction carried over to the next step at non-integer speeds
+    step = 1
+    step_remainder = 0.0
+    flushes = 0
+    # Set once the consumer sent the stop sentinel
+    stopped = False
 
-            current_prev_blocks = None
-            change_mask = None
+    if cap is not None and frame_cache is not None:
+        cache_writer = frame_cache.create(file_path, resolution, glyph_mode, encoder.frame_size,
+                                          cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
 
-            if prev_blocks is None:
-                # Force full redraw for the first frame
-                change_mask = np.ones((h // 2, w), dtype=bool)
-                current_prev_blocks = blocks.copy()
-            else:
-                # Weighted Euclidean-ish Distance (Manhattan on weighted channels)
-                diff_vals = np.abs(blocks - prev_blocks)
-                weighted_diff = diff_vals * perceptual_weights
-                diff_score = np.sum(weighted_diff, axis=(1, 3))
-                
-                change_mask = diff_score > compression
+    try:
+        while True:
+            if shared_flushes is not None and shared_flushes.value != flushes:
+                flushes = shared_flushes.value
+                resume = shared_resume.value
+                if cap is not None and resume != source_index + step:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, resume)
+                    if cache_writer is not None:
+                        cache_writer.discard()
+                        cache_writer = None
+                source_index = resume - 1
+                step = 1
+                step_remainder = 0.0
+                encoder.reset()
+                ready_queue.put((FLUSH_MARKER, flushes))
 
-                # Calculate what the new state WOULD be, but don't commit to prev_blocks yet
-                current_prev_blocks = np.where(change_mask[:, None, :, None], blocks, prev_blocks)
+            source_index += step
 
-            rows, cols = np.where(change_mask)
+            if cached is not None:
+                if source_index >= len(cached):
+                    if shared_flushes is not None:
+                        if _wait_for_flush(free_queue, ready_queue, shared_flushes, flushes):
+                            continue
+                        stopped = True
+                    break
+                resized = cached.frames[source_index]
+            else:
+                if step > 1 and cache_writer is not None:
+                    # Skipped frames aren't resized, so this entry can't be completed
+                    cache_writer.discard()
+                    cache_writer = None
 
-            buffer = bytearray()
+                ret = all(cap.grab() for _ in range(step - 1))
+                if ret:
+                    ret, frame = cap.read()
+                if not ret:
+                    # Only a source that was read to the end is complete enough to be cached
+                    if cache_writer is not None:
+                        cache_writer.finish()
+                        cache_writer = None
+                    if shared_flushes is not None:
+                        if _wait_for_flush(free_queue, ready_queue, shared_flushes, flushes):
+                            continue
+                        stopped = True
+                    break
 
-            if len(rows) > 0:
-                changed_colors = blocks[rows, :, cols, :]
-                top_colors = changed_colors[:, 0, ::-1] 
-                bot_colors = changed_colors[:, 1, ::-1]
+                # Resize frame to target resolution
+                # INTER_LINEAR is faster than INTER_AREA
+                cv2.resize(frame, encoder.frame_size, dst=resized, interpolation=cv2.INTER_LINEAR)
 
-                # Optimization: Vectorized check for solid blocks (Top Color == Bottom Color)
-                # This moves the comparison out of the slow Python loop
-                is_solid = np.all(top_colors == bot_colors, axis=1)
+                if cache_writer is not None:
+                    cache_writer.append(resized, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
 
-                # Force int32 to avoid float conversions and ensure fast Python int access
-                update_data = np.column_stack((
-                    cols, rows, 
-                    top_colors, bot_colors,
-                    is_solid # Add boolean flag as integer (0 or 1)
-                )).astype(np.int32)
+            if shared_interlace is not None:
+                encoder.interlace = shared_interlace.value
+            buffer = encoder.render(resized)
 
-                # Optimization: REMOVED np.lexsort
-                # np.where already returns indices sorted by Row (y), then Column (x).
-                # Sorting again was redundant and expensive.
-                
-                # Convert to list for faster iteration in Python
-                updates_list = update_data.tolist()
+            if shared_stats is not None:
+                for i, field in enumerate(PRODUCER_STAT_FIELDS):
+                    shared_stats[i] = encoder.stats[field]
 
-                # Initialize prev_y to -1 to detect the start of the frame
-                prev_y = -1
-                prev_x = -1
-                
-                # Optimization: Track previous color to avoid redundant ANSI codes
-                prev_r, prev_g, prev_b = -1, -1, -1
-                prev_r2, prev_g2, prev_b2 = -1, -1, -1
-                
-                # Local variable caching for speed
-                _extend = buffer.extend
-                _block_char = BLOCK_CHAR
-                _space_char = b' '
-                _newline_seq = b'\r\n'
-                
-                # Split format strings to allow independent updates
-                _fg_fmt = b'\x1b[38;2;%d;%d;%dm'
-                _bg_fmt = b'\x1b[48;2;%d;%d;%dm'
-
-                for row in updates_list:
-                    x, y = row[0], row[1]
-                    
-                    # Optimization: Efficient Moves
-                    # Added y > 0 check to prevent newline at (0,0) when starting from -1.
-                    # This forces an absolute move for the first line, ensuring correct alignment.
-                    if y == prev_y + 1 and x == 0 and y > 0:
-                        # If we are starting a new line at x=0, just send a newline (2 bytes)
-                        _extend(_newline_seq)
-                    elif y != prev_y or x != prev_x + 1:
-                        # Otherwise, use absolute positioning
-                        _extend(move_sequences[y][x])
-                    
-                    r, g, b = row[2], row[3], row[4]
-                    r2, g2, b2 = row[5], row[6], row[7]
-                    solid_block = row[8] # Retrieved from vectorized check
-
-                    # Optimization: Solid Block Detection
-                    if solid_block:
-                        if (r2 != prev_r2 or g2 != prev_g2 or b2 != prev_b2):
-                            _extend(_bg_fmt % (r2, g2, b2))
-                            prev_r2, prev_g2, prev_b2 = r2, g2, b2
-                        _extend(_space_char)
-                    else:
-                        # Normal Half-Block
-                        if (r != prev_r or g != prev_g or b != prev_b):
-                            _extend(_fg_fmt % (r, g, b))
-                            prev_r, prev_g, prev_b = r, g, b
-                        
-                        if (r2 != prev_r2 or g2 != prev_g2 or b2 != prev_b2):
-                            _extend(_bg_fmt % (r2, g2, b2))
-                            prev_r2, prev_g2, prev_b2 = r2, g2, b2
-                        
-                        _extend(_block_char)
-                    
-                    prev_x = x
-                    prev_y = y
-            
             # --- Shared Memory Transfer ---
-            # Handle data larger than buffer size by chunking (though 64MB should be enough)
-            total_len = len(buffer)
-            sent_len = 0
-            
-            while sent_len < total_len or total_len == 0:
-                # Get a free buffer index (blocks if full)
-                idx = free_queue.get()
-                if idx is None: # Sentinel received
-                    break
-                
-                chunk_size = min(total_len - sent_len, buffer_size)
-                
-                if chunk_size > 0:
-                    offset = idx * buffer_size
-                    # Direct memory copy into shared buffer
-                    shm.buf[offset:offset+chunk_size] = buffer[sent_len:sent_len+chunk_size]
-                
-                # Notify consumer that data is ready
-                # We send the chunk size. If it's a partial frame, the consumer just prints it.
-                # Note: This might cause slight tearing if the consumer sleeps between chunks, 
-                # but with 64MB buffer, this loop usually runs only once.
-                ready_queue.put((idx, chunk_size))
-                
-                sent_len += chunk_size
-                
-                # If total_len was 0 (empty frame), we sent one empty update and break
-                if total_len == 0:
+            if not _send_to_shm(shm, buffer, buffer_size, free_queue, ready_queue, source_index=source_index,
+                                shm_usage=shm_usage):
+                stopped = True
+                break
+
+            frame_number += 1
+
+            # Slow motion shows every frame, the consumer stretches the timing
+            step_remainder += max(shared_speed.value, 1.0) if shared_speed is not None else 1.0
+            step = int(step_remainder)
+            step_remainder -= step
+
+            if keyframe_interval and frame_number % keyframe_interval == 0:
+                # Full redraw of what the screen shows after this frame
+                keyframe = encoder.render_keyframe()
+                if not _send_to_shm(shm, keyframe, buffer_size, free_queue, ready_queue, is_keyframe=True,
+                                    source_index=source_index, shm_usage=shm_usage):
+                    stopped = True
                     break
-            
-            # Wait for feedback from consumer
-            # If consumer rendered the frame, we update prev_blocks.
-            # If consumer skipped the frame, we keep old prev_blocks, so next diff is calculated against the old state.
-            
-            # UPDATE: Removed feedback loop to allow buffering ahead.
-            # We assume sequential playback.
-            prev_blocks = current_prev_blocks
 
     except Exception:
         pass
     finally:
-        cap.release()
-        ready_queue.put(None) # Signal EOF
-        
-        # Allow time for the queue to flush to the pipe before process exit
-        # This prevents the "premature end" where buffered frames are lost when the process dies
-        time.sleep(0.5)
-        
-        shm.close()
+        if cache_writer is not None:
+            cache_writer.discard()
+        if cap is not None:
+            cap.release()
+        _finish_producer(shm, ready_queue, stopped)
 
 class VideoDecoder:
-    def __init__(self, file_path: str, resolution: int, compression: int = 150):
+    def __init__(self, file_path: str, resolution: int, compression: int = 150,
+                 origin: tuple[int, int] = (0, 0), cpu: int | None = None,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, num_buffers: int = DEFAULT_NUM_BUFFERS,
+                 keyframe_interval: int = 0, glyph_mode: str = 'half', scroll: bool = False,
+                 perceptual: bool = False, frame_cache=None, speed: float = 1.0):
+        if glyph_mode not in CELL_SHAPES:
+            raise ValueError(f"Unknown glyph mode '{glyph_mode}', expected one of {', '.join(CELL_SHAPES)}.")
+
         self.file_path = file_path
         self.resolution = resolution if resolution % 2 == 0 else resolution + 1
         self.compression = compression
+        self.origin = origin
+        self.cpu = cpu
+        self.buffer_size = buffer_size
+        self.num_buffers = num_buffers
+        self.keyframe_interval = keyframe_interval
+        self.glyph_mode = glyph_mode
+        # Off by default like in renderer.TerminalRenderer: terminal scroll regions span the full width,
+        # so callers only enable them when nothing is drawn beside the video
+        self.scroll = scroll
+        self.perceptual = perceptual
+        # Optional frame_cache.FrameCache the producer reads resized frames from
+        self.frame_cache = frame_cache
         
         # Open briefly to get metadata, then release.
         # The worker process will open its own handle.
         self.cap = cv2.VideoCapture(self.file_path)
         self.frame_rate = self.cap.get(cv2.CAP_PROP_FPS)
         self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.original_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.original_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         self.cap.release() 
         
-        self.ready_queue = None
-        # self.feedback_queue = None # Removed
-        self.producer_process = None
-        self.shm = None
+        # Written by the producer, read by the consumer without locking
+        self.shared_stats = multiprocessing.Array('q', len(PRODUCER_STAT_FIELDS), lock=False)
+        # Written by the consumer, read by the producer before every frame
+        self.shared_interlace = multiprocessing.Value('i', 1, lock=False)
+        self.shared_speed = multiprocessing.Value('d', speed, lock=False)
+        # Incremented by the consumer to drop the buffered frames, acknowledged with a FLUSH_MARKER
+        self.shared_flushes = multiprocessing.Value('i', 0, lock=False)
+        # Source index the producer continues from after a flush
+        self.shared_resume = multiprocessing.Value('q', 0, lock=False)
+        self.awaiting_flush = False
+        # Source index of the frame yielded last
+        self.position = 0
+        # Bytes written to the shared memory pool by the producer and released by the consumer.
+        # Each side only increments its own counter, so no lock is needed.
+        self.shm_usage = multiprocessing.Array('q', 2, lock=False)
+        # The FramePool of the running diff_frame_generator
+        self.pool = None
 
     def get_frame_rate(self) -> float:
         return self.frame_rate
@@ -241,69 +468,119 @@ class VideoDecoder:
     def get_total_frames(self) -> int:
         return self.total_frames
 
+    def get_frame_size(self) -> tuple[int, int]:
+        """Returns the (columns, rows) of terminal cells the video occupies."""
+        if self.original_height == 0:
+            return 0, 0
+        aspect_ratio = self.original_width / self.original_height
+        return int(self.resolution * aspect_ratio), self.resolution // 2
+
+    def set_interlace(self, level: int):
+        """
+        Makes the producer update only every level-th row per frame, in turns (1 updates every row).
+        The frames already buffered keep their level, so a small pool (see DEGRADE_NUM_BUFFERS)
+        makes the change show sooner.
+        """
+        self.shared_interlace.value = level
+
+    def set_speed(self, speed: float):
+        """
+        Changes the playback speed. Above 1x the producer skips frames, below 1x the consumer
+        has to show every frame for longer. The frames buffered at the old speed are dropped and
+        the producer continues after the frame yielded last, so the change shows with the next frame.
+        """
+        if speed == self.shared_speed.value:
+            return
+        self.shared_speed.value = speed
+        if self.pool is not None:
+            self.shared_resume.value = self.position + 1
+            self.shared_flushes.value += 1
+            self.awaiting_flush = True
+
+    def get_speed(self) -> float:
+        return self.shared_speed.value
+
+    def get_position(self) -> int:
+        """Returns the index of the last yielded frame in the source."""
+        return self.position
+
+    def get_shm_bytes_in_use(self) -> int:
+        """Returns the bytes of encoded frames in the shared memory pool that weren't consumed yet."""
+        return self.shm_usage[0] - self.shm_usage[1]
+
+    def get_shm_capacity(self) -> int:
+        return self.buffer_size * self.num_buffers
+
+    def get_producer_stats(self) -> dict:
+        """Returns the latest counters of the producer process."""
+        return dict(zip(PRODUCER_STAT_FIELDS, self.shared_stats))
+
     def get_buffered_frame_count(self) -> int:
-        if self.ready_queue:
-            try:
-                return self.ready_queue.qsize()
-            except:
-                return 0
-        return 0
-
-    def diff_frame_generator(self):
-        # Allocate 4MB per frame buffer to handle most frames.
-        # Large frames (scene changes) will span multiple chunks.
-        # 4MB * 512 buffers ~= 2GB RAM.
-        BUFFER_SIZE = 4 * 1024 * 1024 
-        NUM_BUFFERS = 512 # Increased buffer depth
-        
-        # Create shared memory block
-        self.shm = shared_memory.SharedMemory(create=True, size=BUFFER_SIZE * NUM_BUFFERS)
-        
-        free_queue = multiprocessing.Queue()
-        self.ready_queue = multiprocessing.Queue()
-        
-        # Initialize free queue with all buffer indices
-        for i in range(NUM_BUFFERS):
-            free_queue.put(i)
-            
-        self.producer_process = multiprocessing.Process(
-            target=_video_producer_process,
-            args=(self.file_path, self.resolution, 
-                  self.shm.name, BUFFER_SIZE, 
-                  free_queue, self.ready_queue, self.compression),
-            daemon=False # Changed to False to ensure queue flushes before exit
-        )
-        self.producer_process.start()
+        return self.pool.get_ready_count() if self.pool is not None else 0
+
+    def diff_frame_generator(self, with_keyframes: bool = False):
+        """
+        Starts the producer process and yields the encoded diff of every frame.
+
+        Args:
+            with_keyframes: If True, yields (data, is_keyframe) tuples and includes the
+                periodic full redraws requested with keyframe_interval. A keyframe describes
+                the screen after the diff yielded right before it.
+        """
+        self.pool = FramePool(self.buffer_size, self.num_buffers)
+        self.pool.start(_video_producer_process, self.file_path, self.resolution,
+                        compression=self.compression, origin=self.origin, cpu=self.cpu,
+                        keyframe_interval=self.keyframe_interval, glyph_mode=self.glyph_mode,
+                        shared_stats=self.shared_stats, scroll=self.scroll, perceptual=self.perceptual,
+                        frame_cache=self.frame_cache, shared_interlace=self.shared_interlace,
+                        shared_speed=self.shared_speed, shared_flushes=self.shared_flushes,
+                        shared_resume=self.shared_resume, shm_usage=self.shm_usage)
+
+        keyframe_chunks = []
 
         try:
             while True:
-                item = self.ready_queue.get()
+                item = self.pool.get()
                 if item is None:
                     break
+
+                if item[0] == END_MARKER:
+                    # Unless frames are being dropped for a flush, the producer has nothing more to send
+                    if self.awaiting_flush:
+                        continue
+                    break
+
+                if item[0] == FLUSH_MARKER:
+                    # Everything after this was encoded at the new speed, starting from a full redraw
+                    if item[1] == self.shared_flushes.value:
+                        self.awaiting_flush = False
+                        keyframe_chunks = []
+                    continue
                 
-                idx, size = item
-                offset = idx * BUFFER_SIZE
-                
-                # Read directly from shared memory
-                # bytes() creates a copy, which is safe as we are about to release the buffer
-                data = bytes(self.shm.buf[offset:offset+size])
-                
-                # Return buffer index to the free queue so producer can reuse it
-                free_queue.put(idx)
+                idx, size, is_keyframe, is_last_chunk, source_index = item
+
+                if self.awaiting_flush:
+                    # Drop frames encoded before the speed change
+                    self.pool.release(idx)
+                    self.shm_usage[1] += size
+                    continue
+
+                data = self.pool.read(idx, size)
+                self.shm_usage[1] += size
+                self.position = source_index
+
+                if is_keyframe:
+                    # Keyframes are only useful whole, so collect all of their chunks first
+                    if not with_keyframes:
+                        continue
+                    keyframe_chunks.append(data)
+                    if is_last_chunk:
+                        yield b''.join(keyframe_chunks), True
+                        keyframe_chunks = []
+                    continue
                 
                 # Yield data
-                yield data
+                yield (data, False) if with_keyframes else data
                 
         finally:
-            # Cleanup resources
-            if self.producer_process.is_alive():
-                # Send sentinel to unblock producer if it's waiting
-                free_queue.put(None)
-                # Also unblock feedback wait if necessary
-                # (Though usually producer dies on queue close or sentinel)
-                self.producer_process.join(timeout=1.0)
-                if self.producer_process.is_alive():
-                    self.producer_process.terminate()
-            
-            self.shm.close()
-            self.shm.unlink() # Mark for deletion
+            self.pool.close()
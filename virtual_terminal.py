@@ -0,0 +1,189 @@
+"""
+A minimal terminal emulator for the escape sequences the encoder emits.
+
+It applies the encoded byte stream to a screen buffer of cells and turns the screen back into
+an image, so encoder changes can be measured as image quality per byte instead of by eye.
+"""
+
+import hashlib
+import re
+
+import cv2
+import numpy as np
+
+from glyphs import CELL_SHAPES, GLYPH_TABLES
+
+# A CSI sequence (with optional private marker), a line break, or a run of printable text
+_TOKEN_PATTERN = re.compile(rb'\x1b\[([?]?)([0-9;]*)([A-Za-z])|(\r\n|\r|\n)|([^\x1b\r\n]+)')
+
+# SSIM stabilizing constants for 8 bit images
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+class VirtualTerminal:
+    """
+    The screen of a terminal, as the foreground color, background color and glyph mask of every cell.
+
+    Args:
+        columns: Width of the screen in cells.
+        rows: Height of the screen in cells.
+        glyph_mode: The glyph mode the stream was encoded with (see glyphs.GLYPH_MODES).
+    """
+
+    def __init__(self, columns: int, rows: int, glyph_mode: str = 'half'):
+        self.columns = columns
+        self.rows = rows
+        self.cell_height, self.cell_width = CELL_SHAPES[glyph_mode]
+
+        # Map every glyph of the mode back to its mask. Characters that aren't glyphs draw nothing.
+        self.glyph_masks = {glyph.decode('utf-8'): mask for mask, glyph in enumerate(GLYPH_TABLES[glyph_mode])}
+
+        # RGB colors and masks of every cell
+        self.foreground = np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.background = np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.masks = np.zeros((rows, columns), dtype=np.int64)
+
+        # Cursor position and scroll region (0-indexed, inclusive)
+        self.x = 0
+        self.y = 0
+        self.scroll_top = 0
+        self.scroll_bottom = rows - 1
+        self.fg_color = (255, 255, 255)
+        self.bg_color = (0, 0, 0)
+
+    def feed(self, data: bytes):
+        """Applies a chunk of the byte stream to the screen. Chunks must not split escape sequences."""
+        for match in _TOKEN_PATTERN.finditer(data):
+            private, params, command, newline, text = match.groups()
+            if text is not None:
+                self._write_text(text.decode('utf-8', errors='replace'))
+            elif newline is not None:
+                self._newline(newline)
+            elif not private:
+                self._apply_csi(params, command)
+
+    def _write_text(self, text: str):
+        for char in text:
+            if 0 <= self.y < self.rows and 0 <= self.x < self.columns:
+                mask = self.glyph_masks.get(char)
+                if mask is not None:
+                    self.foreground[self.y, self.x] = self.fg_color
+                    self.background[self.y, self.x] = self.bg_color
+                    self.masks[self.y, self.x] = mask
+            self.x += 1
+
+    def _newline(self, sequence: bytes):
+        if sequence != b'\n':
+            self.x = 0
+        if sequence == b'\r':
+            return
+        if self.y == self.scroll_bottom:
+            self._scroll(1)
+        else:
+            self.y = min(self.y + 1, self.rows - 1)
+
+    def _apply_csi(self, params: bytes, command: bytes):
+        values = [int(value) if value else 0 for value in params.split(b';')] if params else []
+
+        if command == b'H':
+            row, column = (values + [1, 1])[:2]
+            self.y = max(row, 1) - 1
+            self.x = max(column, 1) - 1
+        elif command == b'm':
+            self._apply_sgr(values or [0])
+        elif command == b'r':
+            # DECSTBM: set the scroll region and home the cursor
+            top, bottom = (values + [0, 0])[:2]
+            self.scroll_top = max(top, 1) - 1
+            self.scroll_bottom = (bottom or self.rows) - 1
+            self.x = self.y = 0
+        elif command == b'S':
+            self._scroll(max(values[0] if values else 1, 1))
+        elif command == b'T':
+            self._scroll(-max(values[0] if values else 1, 1))
+        elif command == b'J' and values and values[0] in (2, 3):
+            self.foreground[:] = 0
+            self.background[:] = 0
+            self.masks[:] = 0
+
+    def _apply_sgr(self, values: list[int]):
+        i = 0
+        while i < len(values):
+            value = values[i]
+            if value == 0:
+                self.fg_color = (255, 255, 255)
+                self.bg_color = (0, 0, 0)
+            elif value in (38, 48) and i + 4 < len(values) and values[i + 1] == 2:
+                color = tuple(values[i + 2:i + 5])
+                if value == 38:
+                    self.fg_color = color
+                else:
+                    self.bg_color = color
+                i += 4
+            i += 1
+
+    def _scroll(self, shift: int):
+        """Moves the rows of the scroll region up (positive) or down (negative), blanking the rows scrolled in."""
+        top, bottom = self.scroll_top, self.scroll_bottom + 1
+        shift = max(min(shift, bottom - top), top - bottom)
+        for plane in (self.foreground, self.background, self.masks):
+            if shift > 0:
+                plane[top:bottom - shift] = plane[top + shift:bottom]
+                plane[bottom - shift:bottom] = 0
+            elif shift < 0:
+                plane[top - shift:bottom] = plane[top:bottom + shift]
+                plane[top:top - shift] = 0
+
+    def get_image(self) -> np.ndarray:
+        """Returns the screen as an image (Rows * Cell_height, Columns * Cell_width, 3) in uint8 BGR."""
+        pixels_per_cell = self.cell_height * self.cell_width
+        # (Rows, Columns, Pixels_per_cell): whether every pixel shows the foreground color
+        selected = (self.masks[:, :, None] >> np.arange(pixels_per_cell)) & 1
+        cells = np.where(selected[..., None].astype(bool),
+                         self.foreground[:, :, None, ::-1], self.background[:, :, None, ::-1])
+        # (Rows, Columns, Cell_height, Cell_width, 3) -> (Rows, Cell_height, Columns, Cell_width, 3)
+        cells = cells.reshape(self.rows, self.columns, self.cell_height, self.cell_width, 3)
+        return np.ascontiguousarray(cells.transpose(0, 2, 1, 3, 4)).reshape(
+            self.rows * self.cell_height, self.columns * self.cell_width, 3)
+
+def replay(stream, columns: int, rows: int, glyph_mode: str = 'half'):
+    """
+    Feeds every frame of an encoded stream (e.g. diff_frame_generator) into a virtual terminal
+    and yields the image displayed after each frame.
+    """
+    terminal = VirtualTerminal(columns, rows, glyph_mode)
+    for data in stream:
+        terminal.feed(data)
+        yield terminal.get_image()
+
+def psnr_from_mse(mse: float) -> float:
+    """Peak signal-to-noise ratio in dB of uint8 images with the given mean squared error."""
+    return float('inf') if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+def psnr(reference: np.ndarray, image: np.ndarray) -> float:
+    """Peak signal-to-noise ratio in dB between two uint8 images."""
+    return psnr_from_mse(np.mean((reference.astype(np.float32) - image.astype(np.float32)) ** 2))
+
+def ssim(reference: np.ndarray, image: np.ndarray) -> float:
+    """Mean structural similarity of the luminance of two uint8 BGR images (Gaussian window, sigma 1.5)."""
+    x = cv2.cvtColor(reference, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    y = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def blur(plane):
+        return cv2.GaussianBlur(plane, (7, 7), 1.5)
+
+    mean_x, mean_y = blur(x), blur(y)
+    variance_x = blur(x * x) - mean_x ** 2
+    variance_y = blur(y * y) - mean_y ** 2
+    covariance = blur(x * y) - mean_x * mean_y
+
+    similarity = ((2 * mean_x * mean_y + _SSIM_C1) * (2 * covariance + _SSIM_C2)) / \
+                 ((mean_x ** 2 + mean_y ** 2 + _SSIM_C1) * (variance_x + variance_y + _SSIM_C2))
+    return float(similarity.mean())
+
+def frame_hash(images) -> str:
+    """Returns a SHA-256 digest over a sequence of displayed images, for golden output checks."""
+    digest = hashlib.sha256()
+    for image in images:
+        digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()